@@ -6,6 +6,7 @@ import time
 import json
 import os
 import math
+import feature_layer_io
 
 logger = None
 batch_size = 2000
@@ -51,59 +52,28 @@ def get_logger(l_dir, t_filename, s_time):
 
 def run_update(the_func):
     def wrapper(*args, **kwargs):
-        global batch_size
         global num_failed_records
         global num_succeeded_records
 
         # Run Function & Collect Update List
         edit_list = the_func(*args)
-        num_total_records = len(edit_list)
 
         if edit_list:
             operation = kwargs.get("operation", None)
-            # Batch Update List Into Smaller Sets
-            # batch_size = kwargs.get("batch", None)
-            use_global_ids = kwargs.get("use_global_ids", False)
-            if not batch_size:
-                batch_size = 1000
-            update_sets = [
-                edit_list[x : x + batch_size]
-                for x in range(0, len(edit_list), batch_size)
-            ]
-            # logger.info("\nProcessing {} Batch(es)\n".format(len(update_sets)))
-
-            # Push Edit Batches
-            try:
-                for update_set in update_sets:
-                    try:
-                        keyStr = ""
-                        if operation == "update":
-                            edit_result = kwargs.get("update").edit_features(updates=update_set, use_global_ids=use_global_ids)
-                            keyStr = "updateResults"
-                        else:  # add
-                            edit_result = kwargs.get("add").edit_features(adds=update_set)
-                            keyStr = "addResults"
-
-
-                        totalRecords = len(edit_result[keyStr])
-
-                        print("updateResults {}: {}".format(totalRecords, edit_result[keyStr]))
-
-                        succeeded_records = len(list(filter(lambda d: d["success"] == True,edit_result[keyStr],)))
-                        logger.info("\nBatch Edit Results: {} of {} succeeded".format(succeeded_records, totalRecords))
-                        num_succeeded_records = num_succeeded_records + succeeded_records
-                        if totalRecords > succeeded_records:
-                            failed_records = list(filter(lambda d: d["success"] == False,edit_result[keyStr],))
-                            num_failed_records = num_failed_records + len(failed_records)
-                            logger.info("\Failed records: {}".format(failed_records))
-
-
-                    except Exception:
-                        logger.info(traceback.format_exc())
-            except Exception:
-                logger.info(traceback.format_exc())
-            finally:
-                logger.info(" \n\n Summary: Total records {}, succeeded records {}, failed records {}".format(num_total_records, num_succeeded_records, num_failed_records))
+            if operation == "update":
+                edit_layer = kwargs.get("update")
+            else:  # add
+                edit_layer = kwargs.get("add")
+
+            # Push Edit Batches, several requests in flight at a time
+            num_succeeded_records, num_failed_records = feature_layer_io.push_edits(
+                edit_layer,
+                edit_list,
+                operation=operation,
+                batch_size=batch_size,
+                use_global_ids=kwargs.get("use_global_ids", False),
+                logger=logger,
+            )
 
         else:
             logger.info("Returned List Was Empty. No Edits Performed.")
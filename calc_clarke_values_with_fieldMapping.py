@@ -6,6 +6,8 @@ import time
 import json
 import os
 import math
+import numpy as np
+import feature_layer_io
 
 logger = None
 batch_size = 2000
@@ -51,59 +53,28 @@ def get_logger(l_dir, t_filename, s_time):
 
 def run_update(the_func):
     def wrapper(*args, **kwargs):
-        global batch_size
         global num_failed_records
         global num_succeeded_records
 
         # Run Function & Collect Update List
         edit_list = the_func(*args)
-        num_total_records = len(edit_list)
 
         if edit_list:
             operation = kwargs.get("operation", None)
-            # Batch Update List Into Smaller Sets
-            # batch_size = kwargs.get("batch", None)
-            use_global_ids = kwargs.get("use_global_ids", False)
-            if not batch_size:
-                batch_size = 1000
-            update_sets = [
-                edit_list[x : x + batch_size]
-                for x in range(0, len(edit_list), batch_size)
-            ]
-            # logger.info("\nProcessing {} Batch(es)\n".format(len(update_sets)))
-
-            # Push Edit Batches
-            try:
-                for update_set in update_sets:
-                    try:
-                        keyStr = ""
-                        if operation == "update":
-                            edit_result = kwargs.get("update").edit_features(updates=update_set, use_global_ids=use_global_ids)
-                            keyStr = "updateResults"
-                        else:  # add
-                            edit_result = kwargs.get("add").edit_features(adds=update_set)
-                            keyStr = "addResults"
-
-
-                        totalRecords = len(edit_result[keyStr])
-
-                        print("updateResults {}: {}".format(totalRecords, edit_result[keyStr]))
-
-                        succeeded_records = len(list(filter(lambda d: d["success"] == True,edit_result[keyStr],)))
-                        logger.info("\nBatch Edit Results: {} of {} succeeded".format(succeeded_records, totalRecords))
-                        num_succeeded_records = num_succeeded_records + succeeded_records
-                        if totalRecords > succeeded_records:
-                            failed_records = list(filter(lambda d: d["success"] == False,edit_result[keyStr],))
-                            num_failed_records = num_failed_records + len(failed_records)
-                            logger.info("\Failed records: {}".format(failed_records))
-
-
-                    except Exception:
-                        logger.info(traceback.format_exc())
-            except Exception:
-                logger.info(traceback.format_exc())
-            finally:
-                logger.info(" \n\n Summary: Total records {}, succeeded records {}, failed records {}".format(num_total_records, num_succeeded_records, num_failed_records))
+            if operation == "update":
+                edit_layer = kwargs.get("update")
+            else:  # add
+                edit_layer = kwargs.get("add")
+
+            # Push Edit Batches, several requests in flight at a time
+            num_succeeded_records, num_failed_records = feature_layer_io.push_edits(
+                edit_layer,
+                edit_list,
+                operation=operation,
+                batch_size=batch_size,
+                use_global_ids=kwargs.get("use_global_ids", False),
+                logger=logger,
+            )
 
         else:
             logger.info("Returned List Was Empty. No Edits Performed.")
@@ -245,45 +216,72 @@ def calc_Clarke_value_percentiles_nthStdDev(taskLyrTble, taskItem, element_field
     # create a new list of fields to use as the out_fields parameter
     out_fields = [object_id_field] + selected_clarke_fields
     logger.info("Out Fields: {}".format(out_fields))
-    query_result = taskLyrTble.query(where="1=1", out_fields=out_fields, return_all_records=True, return_geometry=False)
+
+    # read the layer as batches of columns of the object ids and the clarke values, several objectId ranges at a time
+    oid_pages = []
+    clarke_pages = {clarke_fld_name: [] for clarke_fld_name in selected_clarke_fields}
+    for batch in feature_layer_io.iter_column_batches(taskLyrTble, where="1=1", out_fields=out_fields, logger=logger):
+        oid_pages.append(batch[object_id_field])
+        for clarke_fld_name in selected_clarke_fields:
+            clarke_pages[clarke_fld_name].append(batch[clarke_fld_name].astype(np.float64))
+
+    if len(oid_pages) == 0:
+        logger.info("No features found")
+        return
+
+    oids = np.concatenate(oid_pages).tolist()
+    num_values = len(oids)
+    attributes = [{object_id_field: oid} for oid in oids]
 
     for clarke_fld_name in selected_clarke_fields:
         pct_fld_name = "{}_Pct".format(clarke_fld_name)
         nDev_fld_name = "{}_nDev".format(clarke_fld_name)
-        clarke_log_fld_name = "{}_Log".format(clarke_fld_name)
         logger.info("Processing fields: {}, {}, {}".format(clarke_fld_name, pct_fld_name, nDev_fld_name))
+        clarke_values = np.concatenate(clarke_pages.pop(clarke_fld_name))
+
+        # Null clarke values get null percentiles and nth standard deviations.
+        # Zero and negative values have no log, they are ranked but get null nth standard deviations
+        has_value = ~np.isnan(clarke_values)
+        has_log = has_value & (clarke_values > 0)
+        num_ranked = int(np.count_nonzero(has_value))
+        num_logged = int(np.count_nonzero(has_log))
+        if num_ranked < num_values:
+            logger.info("{} features have no {} value, they are left out".format(num_values - num_ranked, clarke_fld_name))
+        if num_logged < num_ranked:
+            logger.info("{} features have a {} value <= 0 with no log, they are left out of the mean and standard deviation".format(num_ranked - num_logged, clarke_fld_name))
 
         # Calculate the percentiles first
-        # sort the features by the clarke_fld_name
-        query_result.features.sort(key=lambda x: x.attributes[clarke_fld_name])
-        num_values = len(query_result.features)
-        # loop through the features and calculate the percentile for each feature
+        # rank the features by the clarke_fld_name
         logger.info("Calculating Percentiles for each feature")
-        i = 1
-        for f in query_result.features:
-            f.attributes[pct_fld_name] = round(i / num_values, 3)
-            i += 1
-            f.attributes[clarke_log_fld_name] = math.log(f.attributes[clarke_fld_name])
-
-        # Calculate the mean and standard deviation of the clarke_log_fld_name
-        logger.info("Calculating Mean and Standard Deviation for field: {}".format(clarke_log_fld_name))
-        clarke_log_values = [f.attributes[clarke_log_fld_name] for f in query_result.features]
-        mean_value = sum(clarke_log_values) / num_values
-        sum_of_squares = sum([(x - mean_value) ** 2 for x in clarke_log_values])
-        std_dev = (sum_of_squares / num_values) ** 0.5
-        logger.info("Mean: {}, Standard Deviation: {}".format(mean_value, std_dev))
-        logger.info("Calculating nth Standard Deviation for each feature")
-        for f in query_result.features:
-            val = f.attributes[clarke_log_fld_name]
-            f.attributes[nDev_fld_name] = calc_nth_standard_dev(mean_value, std_dev, val)
-            # remove the clarke_log_fld_name and the clarke_fld_name
-            f.attributes.pop(clarke_log_fld_name)
-            f.attributes.pop(clarke_fld_name)
-
-    logger.info("Features info to update: {}".format(query_result.features))
+        order = np.argsort(clarke_values, kind="stable")
+        percentiles = [None] * num_values
+        for i, idx in enumerate(order[:num_ranked].tolist()):  # NaNs sort last
+            percentiles[idx] = round((i + 1) / num_ranked, 3)
+
+        # Calculate the mean and standard deviation of the log of the clarke values
+        logger.info("Calculating Mean and Standard Deviation for field: {}_Log".format(clarke_fld_name))
+        nth_devs = [None] * num_values
+        if num_logged > 0:
+            clarke_log_values = np.log(clarke_values[has_log])
+            mean_value = clarke_log_values.sum() / num_logged
+            std_dev = (((clarke_log_values - mean_value) ** 2).sum() / num_logged) ** 0.5
+            logger.info("Mean: {}, Standard Deviation: {}".format(mean_value, std_dev))
+            logger.info("Calculating nth Standard Deviation for each feature")
+            if std_dev == 0:
+                logger.info("All the {} values are the same, their nth Standard Deviation is 0".format(clarke_fld_name))
+                logged_nth_devs = [0] * num_logged
+            else:
+                logged_nth_devs = calc_nth_standard_dev_array(mean_value, std_dev, clarke_log_values).tolist()
+            for idx, nDev in zip(np.flatnonzero(has_log).tolist(), logged_nth_devs):
+                nth_devs[idx] = nDev
+
+        for attrs, pct, nDev in zip(attributes, percentiles, nth_devs):
+            attrs[pct_fld_name] = pct
+            attrs[nDev_fld_name] = nDev
+
     # Update the features
     logger.info("Updating the features")
-    save_to_featurelayer(query_result.features,update=taskLyrTble, track=None, item=taskItem, operation="update", use_global_ids=False)
+    save_to_featurelayer([{"attributes": attrs} for attrs in attributes],update=taskLyrTble, track=None, item=taskItem, operation="update", use_global_ids=False)
 
 @run_update
 def save_to_featurelayer(process_list):
@@ -299,6 +297,13 @@ def calc_nth_standard_dev(mean_value, std_dev, value):
         return 0 - math.floor((mean_value - value) / std_dev)
 
 
+# Array version of calc_nth_standard_dev
+def calc_nth_standard_dev_array(mean_value, std_dev, values):
+    above = np.floor((values - mean_value) / std_dev)
+    below = 0 - np.floor((mean_value - values) / std_dev)
+    return np.where(values > mean_value, above, below).astype(np.int64)
+
+
 if __name__ == "__main__":
 
     # Get Start Time
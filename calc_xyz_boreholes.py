@@ -1,10 +1,6 @@
 import arcpy
-from geopy import distance
-from geopy.distance import geodesic
-import math
 
 from arcgis.gis import GIS
-import math
 import traceback
 from datetime import datetime
 import logging
@@ -15,6 +11,8 @@ import arcpy
 import sys
 import arcgis
 from arcgis.geometry import Point, project
+import drill_hole_xyz
+import feature_layer_io
 
 logger = None
 batch_size = 2500
@@ -22,6 +20,20 @@ num_failed_records = 0
 num_succeeded_records = 0
 num_total_records = 0
 
+# Maximum number of values in one "field in (...)" where clause, to keep query URLs short
+in_clause_chunk_size = 500
+# Largest deviation from the geodesic path, in meters, accepted by the earth model audit.
+# A task's audit_tolerance_m overrides it. The collar_enu model deviates about
+# d**2 / (2 * R) + d * h / R for a hole reaching d meters horizontally at a height of h meters,
+# see drill_hole_xyz.desurvey_collar_enu. Holes reaching about 1 km horizontally at high
+# elevations exceed the default: a straight horizontal 1.2 km hole at 1500 m deviates 0.30 m
+audit_tolerance_m = 0.25
+# Earth model used to step down the holes when a task has no "earth_model" setting, one of
+# drill_hole_xyz.earth_models or hole_models. This script follows the WGS84 geodesic by default,
+# while calc_xyz_drill_holes, which reads the same config, defaults to "spherical".
+# Set "earth_model" on the task to get the same positions from both scripts
+default_earth_model = "ellipsoidal"
+
 
 def get_config(in_file):
     with open(in_file) as config:
@@ -64,85 +76,28 @@ def get_logger(l_dir, t_filename, s_time):
 
 def run_update(the_func):
     def wrapper(*args, **kwargs):
-        global batch_size
         global num_failed_records
         global num_succeeded_records
 
         # Run Function & Collect Update List
         edit_list = the_func(*args)
-        num_total_records = len(edit_list)
-        num_succeeded_records = 0
-        num_failed_records = 0
 
         if edit_list:
             operation = kwargs.get("operation", None)
-            # Batch Update List Into Smaller Sets
-            # batch_size = kwargs.get("batch", None)
-            use_global_ids = kwargs.get("use_global_ids", False)
-            if not batch_size:
-                batch_size = 1000
-            update_sets = [
-                edit_list[x : x + batch_size]
-                for x in range(0, len(edit_list), batch_size)
-            ]
-            # logger.info("\nProcessing {} Batch(es)\n".format(len(update_sets)))
-
-            # Push Edit Batches
-            try:
-                for update_set in update_sets:
-                    try:
-                        keyStr = ""
-                        if operation == "update":
-                            edit_result = kwargs.get("update").edit_features(
-                                updates=update_set, use_global_ids=use_global_ids
-                            )
-                            keyStr = "updateResults"
-                        else:  # add
-                            edit_result = kwargs.get("add").edit_features(
-                                adds=update_set
-                            )
-                            keyStr = "addResults"
-
-                        totalRecords = len(edit_result[keyStr])
-
-                        succeeded_records = len(
-                            list(
-                                filter(
-                                    lambda d: d["success"] == True,
-                                    edit_result[keyStr],
-                                )
-                            )
-                        )
-                        logger.info(
-                            "\tBatch edit results: {} of {} succeeded".format(
-                                succeeded_records, totalRecords
-                            )
-                        )
-                        num_succeeded_records = (
-                            num_succeeded_records + succeeded_records
-                        )
-                        if totalRecords > succeeded_records:
-                            failed_records = list(
-                                filter(
-                                    lambda d: d["success"] == False,
-                                    edit_result[keyStr],
-                                )
-                            )
-                            num_failed_records = num_failed_records + len(
-                                failed_records
-                            )
-                            logger.info("\Failed records: {}".format(failed_records))
-
-                    except Exception:
-                        logger.info(traceback.format_exc())
-            except Exception:
-                logger.info(traceback.format_exc())
-            finally:
-                logger.info(
-                    " \n\tSummary: Total records {}, succeeded records {}, failed records {}".format(
-                        num_total_records, num_succeeded_records, num_failed_records
-                    )
-                )
+            if operation == "update":
+                edit_layer = kwargs.get("update")
+            else:  # add
+                edit_layer = kwargs.get("add")
+
+            # Push Edit Batches, several requests in flight at a time
+            num_succeeded_records, num_failed_records = feature_layer_io.push_edits(
+                edit_layer,
+                edit_list,
+                operation=operation,
+                batch_size=batch_size,
+                use_global_ids=kwargs.get("use_global_ids", False),
+                logger=logger,
+            )
 
         else:
             logger.info("Returned List Was Empty. No Edits Performed.")
@@ -235,130 +190,46 @@ def updateItemProperties(result_item, rules_to_run, tags_to_inject, gis, complet
             print("Error updating item description: {}".format(e))
 
 
-def calc_borehole_end_xyz(lat, lon, elev, lngth, sections):
-    """
-    Calculate the latitude, longitude, and elevation of the end point of a borehole.
-
-    Parameters:
-    lat (float): Latitude of the entry point (decimal degrees)
-    lon (float): Longitude of the entry point (decimal degrees)
-    elev (float): Elevation of the entry point (meters above sea level)
-    lngth (float): Target lngth to compute position for (meters)
-    sections (list): List of sections in format [[start_lngth, dip, azimuth], ...]
-
-    Returns:
-    dict: {"latitude": new_lat, "longitude": new_lon, "elevation": new_elev}
-    """
-    logger.info(
-        "calc_borehole_end_xyz: lat: {}, lon: {}, elev: {}, lngth: {}".format(
-            lat, lon, elev, lngth
-        )
-    )
-    logger.info("Sections: {}".format(sections))
-
-    current_lat = lat
-    current_lon = lon
-    current_elev = elev
-    remaining_lngth = lngth
-
-    # Process each section in order until the target lngth is reached
-    for i in range(len(sections) - 1):
-        logger.info("Processing section: {}".format(i))
-        section_start, dip, azimuth = sections[i]
-        section_end = sections[i + 1][0]  # Next section start
-        logger.info(
-            "Section: start: {}, end: {}, dip: {}, azimuth: {}".format(
-                section_start, section_end, dip, azimuth
-            )
-        )
-
-        if section_start >= lngth:
-            break  # Stop processing if we've reached the target lngth
-
-        # Determine how much of this section to process
-        section_lngth = min(section_end, lngth) - section_start
-
-        if section_lngth <= 0:
-            continue  # Skip sections that are above the input lngth
-
-        # calculate the xyz using geopy
-
-        # Compute new lat/lon
-        # compute_new_latlon(lat, lon, azimuth, distance_m)
-        current_lat, current_lon = compute_new_latlon(
-            current_lat, current_lon, azimuth, section_lngth, dip
+def sql_in_clauses(field, values, chunk_size=None):
+    # Build "field in (...)" where clauses over chunks of the text values, quotes escaped
+    if not chunk_size:
+        chunk_size = in_clause_chunk_size
+    for x in range(0, len(values), chunk_size):
+        quoted = [
+            "'{}'".format(str(v).replace("'", "''")) for v in values[x : x + chunk_size]
+        ]
+        yield "{} in ({})".format(field, ",".join(quoted))
+
+
+def add_web_mercator_geometry(list_to_update, use_geometry_service=False):
+    # Add a Web Mercator point with z to each record, from its calculated WGS84 lon/lat and elevation
+    lons = [r["attributes"]["lon_calculated"] for r in list_to_update]
+    lats = [r["attributes"]["lat_calculated"] for r in list_to_update]
+
+    if use_geometry_service:
+        # Project all points with a single call to the geometry service
+        pnts_wgs84 = [
+            Point({"x": lon, "y": lat, "spatialReference": {"wkid": 4326}})
+            for lon, lat in zip(lons, lats)
+        ]
+        pnts_webmerc = project(geometries=pnts_wgs84, in_sr=4326, out_sr=102100)
+        xs = [pnt.x for pnt in pnts_webmerc]
+        ys = [pnt.y for pnt in pnts_webmerc]
+    else:
+        xs, ys = drill_hole_xyz.wgs84_to_web_mercator(lons, lats)
+        xs = xs.tolist()
+        ys = ys.tolist()
+
+    for record, x, y in zip(list_to_update, xs, ys):
+        record["geometry"] = Point(
+            {
+                "x": x,
+                "y": y,
+                "z": record["attributes"]["elev_calculated1"],
+                "spatialReference": {"wkid": 102100},
+            }
         )
 
-        # Compute new elevation (Z)
-        current_elev = compute_new_z(current_elev, dip, section_lngth)
-
-        # Stop if we've reached the target lngth
-        if remaining_lngth <= 0:
-            break
-
-    return {
-        "x": current_lon,
-        "y": current_lat,
-        "z": current_elev,
-    }
-
-
-def compute_new_latlon_roundEarth(
-    current_lat, current_lon, current_elev, section_lngth, azimuth, dip
-):
-
-    rad = math.pi / 180  # Convert degrees to radians
-    earth_radius = 6371000  # Earth's radius in meters
-
-    # Convert angles to radians
-    dip_rad = abs(dip) * rad
-    azimuth_rad = azimuth * rad
-
-    # Compute vertical displacement correctly
-    vertical_depth = section_lngth * math.sin(dip_rad)  # Proper accumulation
-
-    # Update elevation correctly
-    current_elev -= vertical_depth
-
-    # calculate the horizontal displacement
-    horizontal_lngth = section_lngth * math.cos(dip_rad)
-
-    # calculate the new latitude by calculating the change in latitude.
-    # The change needs to be in angular units based on the radius of the earth
-    # The change in latitude is the horizontal displacement times the cosine of the azimuth
-    # divided by the radius of the earth
-    delta_lat = (horizontal_lngth * math.cos(azimuth_rad)) / earth_radius
-    current_lat += delta_lat / rad
-    # calculate the new longitude by calculating the change in longitude.
-    # The change needs to be in angular units based on the radius of the circle at the current latitude
-    # The change in longitude is the horizontal displacement times the sine of the azimuth
-    # divided by the radius of the circle at the current latitude
-    delta_lon = (horizontal_lngth * math.sin(azimuth_rad)) / (
-        earth_radius * math.cos(lat * rad)
-    )
-    current_lon += delta_lon / rad
-
-    return current_lat, current_lon, current_elev
-
-
-# Function to calculate new lat/lon based on azimuth and distance
-def compute_new_latlon(lat, lon, azimuth, length_m, dip):
-    distance_m = length_m * math.cos(math.radians(abs(dip)))  # Horizontal displacement
-    # Use geodesic method to compute new coordinates
-    new_point = geodesic(kilometers=distance_m / 1000).destination((lat, lon), azimuth)
-    return new_point.latitude, new_point.longitude
-
-
-# Function to compute new elevation (Z) based on dip angle
-def compute_new_z(z, dip, distance_m):
-    dip_rad = math.radians(abs(dip))
-    dz = distance_m * math.sin(dip_rad)  # Vertical displacement
-    new_z = z - dz
-    logger.info(
-        "compute_new_z: z: {}, dip: {}, dz: {}, new_z {}".format(z, dip, dz, new_z)
-    )
-    return new_z
-
 
 if __name__ == "__main__":
 
@@ -397,15 +268,31 @@ if __name__ == "__main__":
             logger.info("Task Item Title: {}".format(taskItem.title))
             taskLyr = taskItem.layers[taskLyrId]
 
-            # read the unique hole ids from the taskLyr
-            resp_holeIDs = taskLyr.query(
+            # earth model used to step down the holes, see default_earth_model.
+            # "collar_enu" is the fast path, desurveying each hole in the east, north, up frame of its collar
+            earth_model = task.get("earth_model", default_earth_model)
+            # report the maximum deviation of the earth model from the geodesic path,
+            # and the holes deviating more than the tolerance in meters
+            audit_earth_model = task.get("audit_earth_model", False)
+            tolerance_m = task.get("audit_tolerance_m", audit_tolerance_m)
+            max_deviation_m = 0
+            holes_over_tolerance = []
+
+            # read the object id, midpoint length, latitude, and longitude of all the samples to calculate in one query,
+            # then group them by hole ID
+            resp_samples = taskLyr.query(
                 where="Calculated is null or Calculated = 0 or Calculated = 1",  #  and holeID = '{}'".format("C12-62"),
-                out_fields="holeID",
+                out_fields="ObjectId, midpoint_ft, LON_WGS84, LAT_WGS84, holeID",
+                order_by_fields="holeID ASC, midpoint_ft ASC",
                 return_geometry=False,
-                return_distinct_values=True,
+                return_all_records=True,
             )
 
-            hole_ids = [h.attributes["holeID"] for h in resp_holeIDs.features]
+            hole_features = {}
+            for f in resp_samples.features:
+                hole_features.setdefault(f.attributes["holeID"], []).append(f)
+
+            hole_ids = [hId for hId in hole_features if hId is not None]
             logger.info("Unique Hole IDs: {}".format(hole_ids))
 
             if len(hole_ids) == 0:
@@ -416,19 +303,22 @@ if __name__ == "__main__":
             surveyItem = gis.content.get(surveyItemId)
             surveyTable = surveyItem.tables[task["survey_info"]["tableId"]]
 
-            # read the survey table, order by holeID and LENGTH ascending
-            sWhere = "holeID in ('{}')".format("','".join(hole_ids))
-            resp_survey = surveyTable.query(
-                where=sWhere,
-                out_fields="holeID, nLength, DIP, bearing, ELEVATION, LENGTH_1739953335509",
-                return_geometry=False,
-                order_by_fields="holeID ASC, nLength ASC",
-            )
-            logger.info("Survey Table Query Results: {}".format(resp_survey.features))
+            # read the survey table, order by holeID and LENGTH ascending.
+            # The hole IDs are queried in chunks so the where clause stays within URL limits
+            survey_features = []
+            for sWhere in sql_in_clauses("holeID", hole_ids):
+                resp_survey = surveyTable.query(
+                    where=sWhere,
+                    out_fields="holeID, nLength, DIP, bearing, ELEVATION, LENGTH_1739953335509",
+                    return_geometry=False,
+                    order_by_fields="holeID ASC, nLength ASC",
+                )
+                survey_features.extend(resp_survey.features)
+            logger.info("Survey Table Query Results: {}".format(survey_features))
 
             # organize the survey table into a dict in the format of {holeID: {sections: [[LENGTH, DIP, bearing], [LENGTH, DIP, bearing] ...], top_z: ELEVATION}}
             survey_dict = {}
-            for f in resp_survey.features:
+            for f in survey_features:
                 holeID = f.attributes["holeID"]
                 length = f.attributes["nLength"] / 3.28084  # Convert feet to meters
                 dip = f.attributes["DIP"]
@@ -468,28 +358,14 @@ if __name__ == "__main__":
             # Loop through the hole IDs and calculate the xyz coordinates
             list_to_update = []
             for hId in hole_ids:
-                # query the task layer for the hole ID to get the object id, midpoint length, the latitude, and longitude
-                sWhere = "(Calculated is null or Calculated = 0 or Calculated = 1) and holeID = '{}'".format(
-                    hId
-                )
-                resp_hole = taskLyr.query(
-                    where=sWhere,
-                    out_fields="ObjectId, midpoint_ft, LON_WGS84, LAT_WGS84",
-                    order_by_fields="midpoint_ft ASC",
-                    return_geometry=False,
-                )
-
-                if len(resp_hole.features) == 0:
-                    logger.info("No features found for hole ID: {}".format(hId))
-                    continue
-                    # get the object id, midpoint length, latitude, and longitude
-
                 # get the survey data for the hole ID
                 sections = survey_dict[hId]["sections"]
                 top_z = survey_dict[hId]["top_z"]
 
-                previous_x = previous_y = previous_z = None
-                for f in resp_hole.features:
+                # group the features below the collar by their entry point,
+                # so each group is desurveyed in one pass down the hole
+                entry_groups = {}
+                for f in hole_features[hId]:
                     oid = f.attributes["ObjectId"]
                     midpoint_m = (
                         f.attributes["midpoint_ft"] / 3.28084
@@ -510,22 +386,30 @@ if __name__ == "__main__":
                                 }
                             }
                         )
-                        previous_x = lon
-                        previous_y = lat
-                        previous_z = top_z
                     else:
-                        # calcualte the xyz coordinates
-                        # entry_lat if previous_x is not None, else lat
-                        entry_lat = lat if previous_y is not None else lat
-                        entry_lon = lon if previous_x is not None else lon
-                        # entry_elev = previous_z if previous_z is not None else top_z
-                        entry_elev = top_z
-
-                        target_depth = midpoint_m
+                        entry_groups.setdefault((lat, lon), []).append(
+                            (oid, midpoint_m)
+                        )
 
-                        xyz = calc_borehole_end_xyz(
-                            lat, lon, entry_elev, target_depth, sections
+                # calcualte the xyz coordinates
+                for (lat, lon), group in entry_groups.items():
+                    xyzs = drill_hole_xyz.desurvey_at_lengths(
+                        lat, lon, top_z, [g[1] for g in group], sections, earth_model
+                    )
+                    if audit_earth_model:
+                        geodesic_xyzs = drill_hole_xyz.desurvey_at_lengths(
+                            lat, lon, top_z, [g[1] for g in group], sections
                         )
+                        hole_deviation_m = drill_hole_xyz.position_deviations_m(
+                            xyzs, geodesic_xyzs
+                        ).max()
+                        max_deviation_m = max(max_deviation_m, hole_deviation_m)
+                        if (
+                            hole_deviation_m > tolerance_m
+                            and hId not in holes_over_tolerance
+                        ):
+                            holes_over_tolerance.append(hId)
+                    for (oid, midpoint_m), xyz in zip(group, xyzs):
                         list_to_update.append(
                             {
                                 "attributes": {
@@ -537,32 +421,29 @@ if __name__ == "__main__":
                                 }
                             }
                         )
-                        previous_x = xyz["x"]
-                        previous_y = xyz["y"]
-                        previous_z = xyz["z"]
-
-            logger.info("List to update: {}".format(list_to_update))
 
-            # Loop through the list to build the point geometry with z for each record
-            for i in range(len(list_to_update)):
-                # project the lat and lon to the same spatial reference as the task layer
+            if audit_earth_model:
                 logger.info(
-                    "projecting {}".format(list_to_update[i]["attributes"]["OBJECTID"])
-                )
-                pnt_wgs84 = Point(
-                    {
-                        "x": list_to_update[i]["attributes"]["lon_calculated"],
-                        "y": list_to_update[i]["attributes"]["lat_calculated"],
-                        "spatialReference": {"wkid": 4326},
-                    }
+                    "Maximum deviation of the {} model from the geodesic path: {} meters".format(
+                        earth_model, max_deviation_m
+                    )
                 )
+                if holes_over_tolerance:
+                    logger.info(
+                        "{} holes deviate more than {} meters from the geodesic path: {}".format(
+                            len(holes_over_tolerance),
+                            tolerance_m,
+                            holes_over_tolerance,
+                        )
+                    )
+
+            logger.info("List to update: {}".format(list_to_update))
 
-                pnt_webmerc = project(
-                    geometries=[pnt_wgs84], in_sr=4326, out_sr=102100
-                )[0]
-                pnt_webmerc.z = list_to_update[i]["attributes"]["elev_calculated1"]
-                pnt_webmerc.spatialReference = {"wkid": 102100}
-                list_to_update[i]["geometry"] = pnt_webmerc
+            # Build the Web Mercator point geometry with z for each record
+            logger.info("projecting {} records".format(len(list_to_update)))
+            add_web_mercator_geometry(
+                list_to_update, task.get("project_with_geometry_service", False)
+            )
 
             # save the updates to the task layer with update
             save_to_featurelayer(
@@ -1,5 +1,4 @@
 from arcgis.gis import GIS
-import math
 import traceback
 from datetime import datetime
 import logging
@@ -10,6 +9,8 @@ import arcpy
 import sys
 import arcgis
 from arcgis.geometry import Point, project
+import drill_hole_xyz
+import feature_layer_io
 
 logger = None
 batch_size = 2500
@@ -17,6 +18,12 @@ num_failed_records = 0
 num_succeeded_records = 0
 num_total_records = 0
 
+# Earth model used to step down the holes when a task has no "earth_model" setting, one of
+# drill_hole_xyz.earth_models or hole_models. This script steps on a sphere by default, as it
+# always has, while calc_xyz_boreholes, which reads the same config, defaults to "ellipsoidal".
+# Set "earth_model" on the task to get the same positions from both scripts
+default_earth_model = "spherical"
+
 
 def get_config(in_file):
     with open(in_file) as config:
@@ -59,85 +66,28 @@ def get_logger(l_dir, t_filename, s_time):
 
 def run_update(the_func):
     def wrapper(*args, **kwargs):
-        global batch_size
         global num_failed_records
         global num_succeeded_records
 
         # Run Function & Collect Update List
         edit_list = the_func(*args)
-        num_total_records = len(edit_list)
-        num_succeeded_records = 0
-        num_failed_records = 0
 
         if edit_list:
             operation = kwargs.get("operation", None)
-            # Batch Update List Into Smaller Sets
-            # batch_size = kwargs.get("batch", None)
-            use_global_ids = kwargs.get("use_global_ids", False)
-            if not batch_size:
-                batch_size = 1000
-            update_sets = [
-                edit_list[x : x + batch_size]
-                for x in range(0, len(edit_list), batch_size)
-            ]
-            # logger.info("\nProcessing {} Batch(es)\n".format(len(update_sets)))
-
-            # Push Edit Batches
-            try:
-                for update_set in update_sets:
-                    try:
-                        keyStr = ""
-                        if operation == "update":
-                            edit_result = kwargs.get("update").edit_features(
-                                updates=update_set, use_global_ids=use_global_ids
-                            )
-                            keyStr = "updateResults"
-                        else:  # add
-                            edit_result = kwargs.get("add").edit_features(
-                                adds=update_set
-                            )
-                            keyStr = "addResults"
-
-                        totalRecords = len(edit_result[keyStr])
-
-                        succeeded_records = len(
-                            list(
-                                filter(
-                                    lambda d: d["success"] == True,
-                                    edit_result[keyStr],
-                                )
-                            )
-                        )
-                        logger.info(
-                            "\tBatch edit results: {} of {} succeeded".format(
-                                succeeded_records, totalRecords
-                            )
-                        )
-                        num_succeeded_records = (
-                            num_succeeded_records + succeeded_records
-                        )
-                        if totalRecords > succeeded_records:
-                            failed_records = list(
-                                filter(
-                                    lambda d: d["success"] == False,
-                                    edit_result[keyStr],
-                                )
-                            )
-                            num_failed_records = num_failed_records + len(
-                                failed_records
-                            )
-                            logger.info("\Failed records: {}".format(failed_records))
-
-                    except Exception:
-                        logger.info(traceback.format_exc())
-            except Exception:
-                logger.info(traceback.format_exc())
-            finally:
-                logger.info(
-                    " \n\tSummary: Total records {}, succeeded records {}, failed records {}".format(
-                        num_total_records, num_succeeded_records, num_failed_records
-                    )
-                )
+            if operation == "update":
+                edit_layer = kwargs.get("update")
+            else:  # add
+                edit_layer = kwargs.get("add")
+
+            # Push Edit Batches, several requests in flight at a time
+            num_succeeded_records, num_failed_records = feature_layer_io.push_edits(
+                edit_layer,
+                edit_list,
+                operation=operation,
+                batch_size=batch_size,
+                use_global_ids=kwargs.get("use_global_ids", False),
+                logger=logger,
+            )
 
         else:
             logger.info("Returned List Was Empty. No Edits Performed.")
@@ -230,83 +180,6 @@ def updateItemProperties(result_item, rules_to_run, tags_to_inject, gis, complet
             print("Error updating item description: {}".format(e))
 
 
-def drill_hole_end_point(lat, lon, elev, lngth, sections):
-    """
-    Calculate the latitude, longitude, and elevation of the end point of a drill hole.
-
-    Parameters:
-    lat (float): Latitude of the entry point (decimal degrees)
-    lon (float): Longitude of the entry point (decimal degrees)
-    elev (float): Elevation of the entry point (meters above sea level)
-    lngth (float): Target lngth to compute position for (meters)
-    sections (list): List of sections in format [[start_lngth, dip, azimuth], ...]
-
-    Returns:
-    dict: {"latitude": new_lat, "longitude": new_lon, "elevation": new_elev}
-    """
-    rad = math.pi / 180  # Convert degrees to radians
-    earth_radius = 6371000  # Earth's radius in meters
-    current_lat = lat
-    current_lon = lon
-    current_elev = elev
-    remaining_lngth = lngth
-
-    # Process each section in order until the target lngth is reached
-    for i in range(len(sections) - 1):
-        section_start, dip, azimuth = sections[i]
-        section_end = sections[i + 1][0]  # Next section start
-
-        if section_start >= lngth:
-            break  # Stop processing if we've reached the target lngth
-
-        # Determine how much of this section to process
-        section_lngth = min(section_end, lngth) - section_start
-
-        if section_lngth <= 0:
-            continue  # Skip sections that are above the input lngth
-
-        # Convert angles to radians
-        dip_rad = abs(dip) * rad
-        azimuth_rad = azimuth * rad
-
-        # Compute vertical displacement correctly
-        vertical_depth = section_lngth * math.sin(dip_rad)  # Proper accumulation
-
-        # Update elevation correctly
-        current_elev -= vertical_depth
-
-        # Reduce remaining lngth
-        remaining_lngth -= section_lngth
-
-        # calculate the horizontal displacement
-        horizontal_lngth = section_lngth * math.cos(dip_rad)
-
-        # calculate the new latitude by calculating the change in latitude.
-        # The change needs to be in angular units based on the radius of the earth
-        # The change in latitude is the horizontal displacement times the cosine of the azimuth
-        # divided by the radius of the earth
-        delta_lat = (horizontal_lngth * math.cos(azimuth_rad)) / earth_radius
-        current_lat += delta_lat / rad
-        # calculate the new longitude by calculating the change in longitude.
-        # The change needs to be in angular units based on the radius of the circle at the current latitude
-        # The change in longitude is the horizontal displacement times the sine of the azimuth
-        # divided by the radius of the circle at the current latitude
-        delta_lon = (horizontal_lngth * math.sin(azimuth_rad)) / (
-            earth_radius * math.cos(lat * rad)
-        )
-        current_lon += delta_lon / rad
-
-        # Stop if we've reached the target lngth
-        if remaining_lngth <= 0:
-            break
-
-    return {
-        "x": current_lon,
-        "y": current_lat,
-        "z": current_elev,
-    }
-
-
 if __name__ == "__main__":
 
     # Get Start Time
@@ -344,6 +217,9 @@ if __name__ == "__main__":
             logger.info("Task Item Title: {}".format(taskItem.title))
             taskLyr = taskItem.layers[taskLyrId]
 
+            # earth model used to step down the holes, see default_earth_model
+            earth_model = task.get("earth_model", default_earth_model)
+
             # read the unique hole ids from the taskLyr
             resp_holeIDs = taskLyr.query(
                 where="Calculated is null or Calculated = 0 or Calculated = 1",
@@ -410,14 +286,15 @@ if __name__ == "__main__":
                 sections = survey_dict[hId]["sections"]
                 top_z = survey_dict[hId]["top_z"]
 
+                # group the features below the collar by their entry point,
+                # so each group is desurveyed in one pass down the hole
+                entry_groups = {}
                 for f in resp_hole.features:
                     oid = f.attributes["ObjectId"]
                     midpoint_ft = f.attributes["midpoint_ft"]
                     lon = f.attributes["LON_WGS84"]
                     lat = f.attributes["LAT_WGS84"]
 
-                    previous_x = previous_y = previous_z = 0
-
                     if midpoint_ft == 0:
                         # if the midpoint length is 0, its elevation is the elevation of the first survey point
                         list_to_update.append(
@@ -431,23 +308,22 @@ if __name__ == "__main__":
                                 }
                             }
                         )
-                        previous_x = lon
-                        previous_y = lat
-                        previous_z = top_z
                     else:
-                        # calcualte the xyz coordinates
-                        # entry_lat if previous_x is not None, else lat
-                        entry_lat = lat if previous_y is not None else lat
-                        entry_lon = lon if previous_x is not None else lon
-                        entry_elev = (
-                            previous_z if previous_z is not None else top_z / 3.28084
-                        )
-
                         target_depth = midpoint_ft / 3.28084  # Convert feet to meters
-
-                        xyz = drill_hole_end_point(
-                            lat, lon, entry_elev, target_depth, sections
+                        entry_groups.setdefault((lat, lon), []).append(
+                            (oid, target_depth)
                         )
+
+                # calcualte the xyz coordinates.
+                # The holes are entered at an elevation of 0, as when each sample was
+                # desurveyed on its own with its previous elevation reset to 0
+                entry_elev = 0
+                for (lat, lon), group in entry_groups.items():
+                    target_depths = [g[1] for g in group]
+                    xyzs = drill_hole_xyz.desurvey_at_lengths(
+                        lat, lon, entry_elev, target_depths, sections, earth_model
+                    )
+                    for (oid, target_depth), xyz in zip(group, xyzs):
                         list_to_update.append(
                             {
                                 "attributes": {
@@ -459,9 +335,6 @@ if __name__ == "__main__":
                                 }
                             }
                         )
-                        previous_x = xyz["x"]
-                        previous_y = xyz["y"]
-                        previous_z = xyz["z"]
 
             logger.info("List to update: {}".format(list_to_update))
 
@@ -1,9 +1,13 @@
 import arcpy
+import numpy as np
 import pandas as pd
 from arcgis.features import GeoAccessor
 import os
 import math
 import gc
+import json
+import sys
+import multiprocessing
 
 
 global x_field, y_field, z_field, length_field, dip_field, bearing_field, hole_id_field, output_max_length_field
@@ -29,6 +33,13 @@ from_len_field = "from_m"  # from_m or from_ft
 to_len_field = "to_m"  # to_m or to_ft
 # hole_id_field = "holeID"
 
+# Log every vertex of every borehole line, for debugging
+debug_messages = False
+# Log the insert progress every this many borehole lines
+progress_interval = 1000
+# Desurvey the holes in this many worker processes. 1 desurveys them in this process
+num_processes = 1
+
 ######################################################################
 
 output_max_length_field = "max_length_ft" if unit_xyz == "ft" else "max_length_m"
@@ -159,6 +170,136 @@ def minimum_curvature(md_1, incl_1, azm_1, md_2, incl_2, azm_2):
     return [md_2, delta_tvd, delta_ew, delta_ns]
 
 
+def minimum_curvature_arrays(md_1, incl_1, azm_1, md_2, incl_2, azm_2):
+    """Vectorized minimum_curvature over arrays of station pairs"""
+
+    cos_beta = np.cos(np.radians(incl_2 - incl_1)) - np.sin(
+        np.radians(incl_1)
+    ) * np.sin(np.radians(incl_2)) * (1 - np.cos(np.radians(azm_2 - azm_1)))
+    # Clip the round-off that can push cos_beta just outside [-1, 1]
+    beta = np.arccos(np.clip(cos_beta, -1.0, 1.0))
+
+    # Set rf = 1 when beta == 0 to handle division by zero error
+    rf = np.ones_like(beta)
+    bent = beta != 0
+    rf[bent] = (2 / beta[bent]) * np.tan(beta[bent] / 2)
+
+    delta_md = md_2 - md_1
+    delta_ew = (
+        (delta_md / 2)
+        * (
+            np.sin(np.radians(incl_1)) * np.sin(np.radians(azm_1))
+            + np.sin(np.radians(incl_2)) * np.sin(np.radians(azm_2))
+        )
+        * rf
+    )
+    delta_ns = (
+        (delta_md / 2)
+        * (
+            np.sin(np.radians(incl_1)) * np.cos(np.radians(azm_1))
+            + np.sin(np.radians(incl_2)) * np.cos(np.radians(azm_2))
+        )
+        * rf
+    )
+    delta_tvd = (
+        (delta_md / 2) * (np.cos(np.radians(incl_1)) + np.cos(np.radians(incl_2))) * rf
+    )
+
+    return delta_tvd, delta_ew, delta_ns
+
+
+def average_angle_arrays(md_1, incl_1, azm_1, md_2, incl_2, azm_2):
+    """Vectorized average_angle over arrays of station pairs"""
+
+    delta_md = md_2 - md_1
+    incl_avg = np.radians((incl_1 + incl_2) / 2)
+    azm_avg = np.radians((azm_1 + azm_2) / 2)
+    delta_ns = delta_md * np.sin(incl_avg) * np.cos(azm_avg)
+    delta_ew = delta_md * np.sin(incl_avg) * np.sin(azm_avg)
+    delta_tvd = delta_md * np.cos(incl_avg)
+
+    return delta_tvd, delta_ew, delta_ns
+
+
+def radius_curvature_arrays(md_1, incl_1, azm_1, md_2, incl_2, azm_2):
+    """Vectorized radius_curvature over arrays of station pairs"""
+
+    delta_md = md_2 - md_1
+
+    # Same 0.000001 padding as radius_curvature, only where the angles do not change
+    padding = np.where((incl_2 == incl_1) | (azm_2 == azm_1), 0.000001, 0.0)
+
+    delta_ns = (
+        delta_md
+        * (np.cos(np.radians(incl_1)) - np.cos(np.radians(incl_2)))
+        * (np.sin(np.radians(azm_2)) - np.sin(np.radians(azm_1)))
+        * math.pow(180 / math.pi, 2)
+        / ((incl_2 - incl_1) * (azm_2 - azm_1) + padding)
+    )
+    delta_ew = (
+        delta_md
+        * (np.cos(np.radians(incl_1)) - np.cos(np.radians(incl_2)))
+        * (np.cos(np.radians(azm_1)) - np.cos(np.radians(azm_2)))
+        * math.pow(180 / math.pi, 2)
+        / ((incl_2 - incl_1) * (azm_2 - azm_1) + padding)
+    )
+    delta_tvd = (
+        delta_md
+        * (np.sin(np.radians(incl_2)) - np.sin(np.radians(incl_1)))
+        * 180
+        / ((incl_2 - incl_1) * math.pi + padding)
+    )
+
+    return delta_tvd, delta_ew, delta_ns
+
+
+desurvey_methods = {
+    "Minimum Curvature": minimum_curvature_arrays,
+    "Average Angle": average_angle_arrays,
+    "Radius of Curvature": radius_curvature_arrays,
+}
+
+
+def desurvey_holes(md, dip, azm, hole_offsets, method):
+    # Desurvey the stations of every hole in one pass.
+    # md, dip and azm hold the stations of all holes back to back, and the stations
+    # of hole i are md[hole_offsets[i]:hole_offsets[i + 1]].
+    # Returns the cumulative tvd, ew and ns of every station relative to its collar
+    md = np.asarray(md, dtype=np.float64)
+    incl = 90 - np.asarray(dip, dtype=np.float64)
+    azm = np.asarray(azm, dtype=np.float64)
+    hole_offsets = np.asarray(hole_offsets, dtype=np.int64)
+
+    deltas = desurvey_methods[method](
+        md[:-1], incl[:-1], azm[:-1], md[1:], incl[1:], azm[1:]
+    )
+
+    # Accumulate the deltas of all holes with one running sum, then subtract the
+    # sum reached at each collar. The step into the first station of a hole is the
+    # last station of the previous hole, so it is zeroed
+    hole_starts = hole_offsets[:-1]
+    hole_lengths = np.diff(hole_offsets)
+    results = []
+    for delta in deltas:
+        steps = np.zeros(len(md), dtype=np.float64)
+        steps[1:] = delta
+        steps[hole_starts[hole_lengths > 0]] = 0
+
+        # Keep a bad step from spilling into the next holes through the running sum,
+        # and give it and the rest of its hole NaN as the scalar loop does
+        bad = ~np.isfinite(steps)
+        steps[bad] = 0
+        accumulated = np.cumsum(steps)
+        num_bad = np.cumsum(bad)
+        collar_rows = np.repeat(hole_starts, hole_lengths)
+        accumulated -= accumulated[collar_rows]
+        accumulated[num_bad > num_bad[collar_rows]] = np.nan
+        results.append(accumulated)
+
+    tvd, ew, ns = results
+    return tvd, ew, ns
+
+
 def read_collar_data_to_sdf(collar_Table):
     # Read the collar table, which can be a feature class, or a table, or a csv, into a pandas DataFrame
     if collar_Table.lower().endswith(".csv"):
@@ -196,10 +337,13 @@ def read_collar_data_to_sdf(collar_Table):
     return collar_df
 
 
-def read_survey_data_to_dict(survey_Table, collar_sdf):
-    # organize the survey table into a dict in the format of
-    # {holeID: {sections: [[LENGTH, DIP, bearing], [LENGTH, DIP, bearing] ...],
-    # top_x: xxxx, top_y: yyyyyy, top_z: zzzzzzz}}
+def read_survey_data_to_arrays(survey_Table, collar_sdf):
+    # organize the survey table into per-hole contiguous arrays in the format of
+    # {hole_ids: [holeID, ...], hole_offsets: [0, n1, n1 + n2, ...],
+    # md: [...], dip: [...], bearing: [...],
+    # top_x: [...], top_y: [...], top_z: [...]}
+    # The stations of hole i are md[hole_offsets[i]:hole_offsets[i + 1]],
+    # and top_x[i], top_y[i], top_z[i] are its collar coordinates
     if survey_Table.lower().endswith(".csv"):
         survey_df = pd.read_csv(
             survey_Table,
@@ -207,51 +351,77 @@ def read_survey_data_to_dict(survey_Table, collar_sdf):
             encoding="ansi",
         )
     else:
-        survey_df = GeoAccessor.from_table(survey_Table)
+        survey_df = GeoAccessor.from_table(
+            survey_Table,
+            fields=[length_field, dip_field, bearing_field, hole_id_field],
+        )
 
     # Check if the survey data is empty
     if survey_df.empty:
         arcpy.AddError("Survey data is empty.")
         return None
 
+    # index the collars by hole id, keeping the first collar of each hole
+    collar_lookup = collar_sdf.drop_duplicates(subset=hole_id_field).set_index(
+        hole_id_field
+    )
+
+    # drop the survey rows of holes without a collar
+    has_collar = survey_df[hole_id_field].isin(collar_lookup.index)
+    for hole_id in survey_df.loc[~has_collar, hole_id_field].unique():
+        arcpy.AddWarning(f"Collar data not found for hole {hole_id}.")
+    survey_df = survey_df[has_collar]
+    if survey_df.empty:
+        arcpy.AddError("No survey data matches the collar data.")
+        return None
+
     # order the survey data by hole id and length ascending
     survey_df = survey_df.sort_values(
-        [hole_id_field, length_field], ascending=[True, True]
+        [hole_id_field, length_field], ascending=[True, True], kind="mergesort"
     )
 
-    survey_dict = {}
-    for index, row in survey_df.iterrows():
-        hole_id = row[hole_id_field]
-        if hole_id not in survey_dict:
-            # find the collar elevation for this hole
-            collar_row = collar_sdf[collar_sdf[hole_id_field] == hole_id]
-            if collar_row.empty:
-                arcpy.AddWarning(f"Collar data not found for hole {hole_id}.")
-                continue
-            # add the collar elevation to the survey_dict
-            survey_dict[hole_id] = {
-                "sections": [],
-                "top_x": collar_row[x_field].values[0],
-                "top_y": collar_row[y_field].values[0],
-                "top_z": collar_row[z_field].values[0],
-                "top_dip": collar_row[dip_field_in_collar].values[0],
-                "top_bearing": collar_row[bearing_field_in_collar].values[0],
-            }
+    ids = survey_df[hole_id_field].to_numpy()
+    md = survey_df[length_field].to_numpy(dtype=np.float64)
+    dip = survey_df[dip_field].to_numpy(dtype=np.float64)
+    bearing = survey_df[bearing_field].to_numpy(dtype=np.float64)
+
+    # find where each hole starts in the sorted rows
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    hole_ids = ids[starts]
+    counts = np.diff(np.r_[starts, len(ids)])
+
+    collars = collar_lookup.loc[hole_ids]
+
+    # if the first length of a hole is not 0, add a station at length 0,
+    # with the dip and bearing from the collar
+    needs_top = md[starts] != 0
+    insert_at = starts[needs_top]
+    md = np.insert(md, insert_at, 0)
+    dip = np.insert(
+        dip,
+        insert_at,
+        collars[dip_field_in_collar].to_numpy(dtype=np.float64)[needs_top],
+    )
+    bearing = np.insert(
+        bearing,
+        insert_at,
+        collars[bearing_field_in_collar].to_numpy(dtype=np.float64)[needs_top],
+    )
 
-            # if the length is not 0, add a section with length 0, dip and bearing from the top values
-            if row[length_field] != 0:
-                survey_dict[hole_id]["sections"].append(
-                    [
-                        0,
-                        survey_dict[hole_id]["top_dip"],
-                        survey_dict[hole_id]["top_bearing"],
-                    ]
-                )
-        # append the survey data to the survey_dict
-        survey_dict[hole_id]["sections"].append(
-            [row[length_field], row[dip_field], row[bearing_field]]
-        )
-    return survey_dict
+    hole_offsets = np.zeros(len(hole_ids) + 1, dtype=np.int64)
+    hole_offsets[1:] = np.cumsum(counts + needs_top)
+
+    survey_arrays = {
+        "hole_ids": hole_ids,
+        "hole_offsets": hole_offsets,
+        "md": md,
+        "dip": dip,
+        "bearing": bearing,
+        "top_x": collars[x_field].to_numpy(dtype=np.float64),
+        "top_y": collars[y_field].to_numpy(dtype=np.float64),
+        "top_z": collars[z_field].to_numpy(dtype=np.float64),
+    }
+    return survey_arrays
 
 
 def check_Existence_and_Fields(table, required_fields, tbl_Title):
@@ -273,11 +443,11 @@ def check_Existence_and_Fields(table, required_fields, tbl_Title):
     return True
 
 
-def extend_lengths(survey_dict, lab_Table):
+def extend_lengths(survey_arrays, lab_Table):
     # Check if the lab table exists
     if not arcpy.Exists(lab_Table):
         arcpy.AddError(f"Lab table {lab_Table} does not exist.")
-        return survey_dict
+        return survey_arrays
 
     # Read the lab data into a pandas DataFrame
     if lab_Table.lower().endswith(".csv"):
@@ -290,36 +460,60 @@ def extend_lengths(survey_dict, lab_Table):
     # check if the lab table is empty
     if lab_df.empty:
         arcpy.AddError("Lab data is empty.")
-        return survey_dict
-
-    for hole_id in survey_dict.keys():
-        #  get the maximum length from the lab table
-        #           and check if the maximum length is > the survey max length
-        #           If so, add a new section to the survey_dict with the maximum length
-        #           and the dip and bearing from the last section of the survey_dict
-
-        lab_hole_df = lab_df[lab_df[hole_id_field] == hole_id]
-        if lab_hole_df.empty:
-            arcpy.AddWarning(f"Lab data not found for hole {hole_id}.")
-            continue
-        # get the maximum length from the lab table
-        max_to_len = lab_hole_df[to_len_field].max()
-        # check if the maximum length is greater than the survey max length
-        if max_to_len > survey_dict[hole_id]["sections"][-1][0]:
-            # display max_to_len and survey_dict[hole_id]["sections"][-1][0]
-            arcpy.AddMessage(
-                f"Hole {hole_id}: Max length from lab table: {max_to_len} > Survey max: {survey_dict[hole_id]['sections'][-1][0]}. Extending"
-            )
+        return survey_arrays
+
+    # get the maximum length of every hole from the lab table in one pass
+    max_to_len_index = lab_df.groupby(hole_id_field)[to_len_field].max()
+
+    hole_ids = survey_arrays["hole_ids"]
+    max_to_lens = max_to_len_index.reindex(hole_ids).to_numpy(dtype=np.float64)
+    for hole_id in hole_ids[np.isnan(max_to_lens)]:
+        arcpy.AddWarning(f"Lab data not found for hole {hole_id}.")
+
+    # check if the maximum length is greater than the survey max length.
+    # If so, add a new station to the hole with the maximum length
+    # and the dip and bearing from the last station of the hole
+    survey_max_lens = survey_arrays["md"][survey_arrays["hole_offsets"][1:] - 1]
+    holes_to_extend = np.flatnonzero(max_to_lens > survey_max_lens)
+    for i in holes_to_extend:
+        arcpy.AddMessage(
+            f"Hole {hole_ids[i]}: Max length from lab table: {max_to_lens[i]} > Survey max: {survey_max_lens[i]}. Extending"
+        )
+    arcpy.AddMessage(
+        f"Extended {len(holes_to_extend)} of {len(hole_ids)} holes to the lab max length."
+    )
+
+    return append_last_stations(
+        survey_arrays, holes_to_extend, max_to_lens[holes_to_extend]
+    )
 
-            # add a new section to the survey_dict with the maximum length
-            # and the dip and bearing from the last section of the survey_dict
-            survey_dict[hole_id]["sections"].append(
-                [
-                    max_to_len,
-                    survey_dict[hole_id]["sections"][-1][1],
-                    survey_dict[hole_id]["sections"][-1][2],
-                ]
-            )
+
+def append_last_stations(survey_arrays, hole_indexes, lengths):
+    # add a new station to the end of each hole in hole_indexes with the length in lengths,
+    # and the dip and bearing from the last station of the hole
+    hole_indexes = np.asarray(hole_indexes, dtype=np.int64)
+    if len(hole_indexes) == 0:
+        return survey_arrays
+
+    hole_offsets = survey_arrays["hole_offsets"]
+    insert_at = hole_offsets[hole_indexes + 1]
+    last_stations = insert_at - 1
+
+    extended_arrays = dict(survey_arrays)
+    extended_arrays["md"] = np.insert(
+        survey_arrays["md"], insert_at, np.asarray(lengths, dtype=np.float64)
+    )
+    for fld in ["dip", "bearing"]:
+        extended_arrays[fld] = np.insert(
+            survey_arrays[fld], insert_at, survey_arrays[fld][last_stations]
+        )
+
+    # shift the offsets of every hole after an extended one
+    added = np.zeros(len(hole_offsets), dtype=np.int64)
+    added[hole_indexes + 1] = 1
+    extended_arrays["hole_offsets"] = hole_offsets + np.cumsum(added)
+
+    return extended_arrays
 
 
 def script_tool(
@@ -364,30 +558,34 @@ def script_tool(
         arcpy.AddError("Collar data is empty.")
         return
 
-    # Read the survey data into a dictionary
-    survey_dict = read_survey_data_to_dict(survey_Table, collar_sdf)
+    # Read the survey data into per-hole arrays
+    survey_arrays = read_survey_data_to_arrays(survey_Table, collar_sdf)
+    if survey_arrays is None:
+        return
 
-    extend_lengths(survey_dict, lab_Table)
+    survey_arrays = extend_lengths(survey_arrays, lab_Table)
 
-    boreRows = []
-    for hole_id in survey_dict.keys():
-        arcpy.AddMessage(f"Creating hole {hole_id}...")
-        borehole_dict = survey_dict[hole_id]
-        borehole_line, max_length = create_borehole_line(
-            hole_id, borehole_dict, method, spatial_reference
+    # Desurvey the stations of all holes in one pass, or split across worker processes
+    if num_processes > 1:
+        x, y, z, m = compute_borehole_vertices_parallel(
+            survey_arrays, method, num_processes
         )
-        boreRows.append((hole_id, max_length, borehole_line))
+    else:
+        x, y, z, m = compute_borehole_vertices(survey_arrays, method)
 
-    ins_cursor = arcpy.da.InsertCursor(
-        out_3D_Polyline_FC, [hole_id_field, output_max_length_field, "SHAPE@"]
+    insert_borehole_lines(
+        out_3D_Polyline_FC,
+        survey_arrays["hole_ids"],
+        survey_arrays["hole_offsets"],
+        x,
+        y,
+        z,
+        m,
     )
-    for boreRow in boreRows:
-        ins_cursor.insertRow(boreRow)
-    del ins_cursor
 
     del collar_sdf
-    del survey_dict
-    del boreRows
+    del survey_arrays
+    del x, y, z, m
     gc.collect()
 
     arcpy.AddMessage(f"Borehole lines created in {out_3D_Polyline_FC}")
@@ -416,67 +614,127 @@ def create_output_feature_class(out_3D_Polyline_FC, spatial_reference):
     arcpy.management.AddField(out_3D_Polyline_FC, output_max_length_field, "DOUBLE")
 
 
-def create_borehole_line(hole_id, borehole_dict, method, spatial_reference):
-    x_start = borehole_dict["top_x"]
-    y_start = borehole_dict["top_y"]
-    z_start = borehole_dict["top_z"]
-
-    sections = borehole_dict["sections"]
-    max_length = sections[-1][0]
-    xyz_deltas = [[0, 0, 0, 0]]
-    previous_value = [0, 0, 0, 0]
-
-    for i in range(0, len(sections) - 1):
-        md_1, dip_1, azm_1 = sections[i]
-        md_2, dip_2, azm_2 = sections[i + 1]
-        incl_1 = 90 - dip_1
-        incl_2 = 90 - dip_2
-
-        if method == "Minimum Curvature":
-            new_value = minimum_curvature(md_1, incl_1, azm_1, md_2, incl_2, azm_2)
-        elif method == "Average Angle":
-            new_value = average_angle(md_1, incl_1, azm_1, md_2, incl_2, azm_2)
-        elif method == "Radius of Curvature":
-            new_value = radius_curvature(md_1, incl_1, azm_1, md_2, incl_2, azm_2)
-
-        accumulated_value = [
-            new_value[0],
-            previous_value[1] + new_value[1],
-            previous_value[2] + new_value[2],
-            previous_value[3] + new_value[3],
-        ]
+def compute_borehole_vertices(survey_arrays, method):
+    # Desurvey the stations of all holes and place them relative to their collars.
+    # Returns the x, y, z and m of every vertex, laid out like the survey stations
+    hole_offsets = survey_arrays["hole_offsets"]
+    md = survey_arrays["md"]
+    tvd, ew, ns = desurvey_holes(
+        md, survey_arrays["dip"], survey_arrays["bearing"], hole_offsets, method
+    )
 
-        previous_value = list(accumulated_value)
+    hole_lengths = np.diff(hole_offsets)
+    x = np.repeat(survey_arrays["top_x"], hole_lengths) + ew
+    y = np.repeat(survey_arrays["top_y"], hole_lengths) + ns
+    z = np.repeat(survey_arrays["top_z"], hole_lengths) + tvd
 
-        xyz_deltas.append(accumulated_value)
+    return x, y, z, md
 
-    pnt_array = arcpy.Array()
 
-    for xyz_delta in xyz_deltas:
-        md = xyz_delta[0]
-        tvd = xyz_delta[1]
-        ew = xyz_delta[2]
-        ns = xyz_delta[3]
+def split_survey_arrays(survey_arrays, num_chunks):
+    # Split the survey arrays into about num_chunks runs of whole holes with similar station counts
+    hole_offsets = survey_arrays["hole_offsets"]
+    station_edges = np.linspace(0, hole_offsets[-1], num_chunks + 1)
+    hole_edges = np.unique(
+        np.r_[
+            0,
+            np.searchsorted(hole_offsets[:-1], station_edges[1:-1]),
+            len(hole_offsets) - 1,
+        ]
+    )
 
-        pnt = arcpy.Point(X=x_start + ew, Y=y_start + ns, Z=z_start + tvd, M=md)
-        pnt_array.add(pnt)
+    chunks = []
+    for first_hole, end_hole in zip(hole_edges[:-1], hole_edges[1:]):
+        first_station = hole_offsets[first_hole]
+        end_station = hole_offsets[end_hole]
+        chunks.append(
+            {
+                "hole_offsets": hole_offsets[first_hole : end_hole + 1] - first_station,
+                "md": survey_arrays["md"][first_station:end_station],
+                "dip": survey_arrays["dip"][first_station:end_station],
+                "bearing": survey_arrays["bearing"][first_station:end_station],
+                "top_x": survey_arrays["top_x"][first_hole:end_hole],
+                "top_y": survey_arrays["top_y"][first_hole:end_hole],
+                "top_z": survey_arrays["top_z"][first_hole:end_hole],
+            }
+        )
+
+    return chunks
 
-    # display the point array
-    # loop through the point array and print the values
-    for i in range(pnt_array.count):
-        pnt = pnt_array.getObject(i)
-        arcpy.AddMessage(f"Point {i}: X={pnt.X}, Y={pnt.Y}, Z={pnt.Z}, M={pnt.M}")
 
-    if pnt_array.count < 2:
-        arcpy.AddWarning(
-            "Only {} points. Needing at least two points.".format(pnt_array.count)
+def compute_borehole_vertices_parallel(survey_arrays, method, num_processes):
+    # Desurvey chunks of holes in worker processes. The workers only send back
+    # the x, y, z and m arrays of their chunk, which are joined in hole order
+    chunks = split_survey_arrays(survey_arrays, num_processes * 4)
+    arcpy.AddMessage(
+        f"Desurveying {len(survey_arrays['hole_ids'])} holes in {len(chunks)} chunks with {num_processes} processes..."
+    )
+
+    # In ArcGIS Pro, sys.executable is ArcGISPro.exe, so start the workers with its python
+    if os.path.basename(sys.executable).lower() == "arcgispro.exe":
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "pythonw.exe"))
+
+    with multiprocessing.Pool(num_processes) as pool:
+        results = pool.starmap(
+            compute_borehole_vertices, [(chunk, method) for chunk in chunks]
         )
-        return None, 0
 
-    # Create a polyline from the point array
-    borehole_line = arcpy.Polyline(pnt_array, spatial_reference, has_z=True, has_m=True)
+    x, y, z, m = [np.concatenate([result[i] for result in results]) for i in range(4)]
+    return x, y, z, m
+
+
+def borehole_line_json(x, y, z, m):
+    # Build the Esri JSON of a polyline with z and m values from its vertex arrays
+    return json.dumps(
+        {
+            "hasZ": True,
+            "hasM": True,
+            "paths": [np.column_stack((x, y, z, m)).tolist()],
+        }
+    )
+
 
-    return borehole_line, max_length
+def insert_borehole_lines(out_3D_Polyline_FC, hole_ids, hole_offsets, x, y, z, m):
+    # Insert one polyline per hole. The geometries are written as Esri JSON,
+    # and take the spatial reference of the output feature class
+    ins_cursor = arcpy.da.InsertCursor(
+        out_3D_Polyline_FC, [hole_id_field, output_max_length_field, "SHAPE@JSON"]
+    )
+
+    num_holes = len(hole_ids)
+    for i, hole_id in enumerate(hole_ids):
+        start = hole_offsets[i]
+        end = hole_offsets[i + 1]
+
+        if debug_messages:
+            arcpy.AddMessage(f"Creating hole {hole_id}...")
+            for j in range(start, end):
+                arcpy.AddMessage(
+                    f"Point {j - start}: X={x[j]}, Y={y[j]}, Z={z[j]}, M={m[j]}"
+                )
+
+        if end - start < 2:
+            arcpy.AddWarning(
+                "Hole {}: Only {} points. Needing at least two points.".format(
+                    hole_id, end - start
+                )
+            )
+            ins_cursor.insertRow((hole_id, 0, None))
+        else:
+            ins_cursor.insertRow(
+                (
+                    hole_id,
+                    float(m[end - 1]),
+                    borehole_line_json(
+                        x[start:end], y[start:end], z[start:end], m[start:end]
+                    ),
+                )
+            )
+
+        if (i + 1) % progress_interval == 0:
+            arcpy.AddMessage(f"Inserted {i + 1} of {num_holes} borehole lines...")
+
+    del ins_cursor
 
 
 if __name__ == "__main__":
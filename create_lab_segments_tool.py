@@ -3,11 +3,12 @@ Script documentation
 """
 
 import arcpy
+import numpy as np
 import pandas as pd
 from arcgis.features import GeoAccessor
 import os
 import json
-
+import itertools
 
 global x_field, y_field, z_field, length_field, dip_field, bearing_field, hole_id_field
 # Required field names in the borehole line feature class
@@ -18,6 +19,15 @@ hole_id_field = "holeID"
 from_len_field = "from_m"  # from_m or from_ft
 to_len_field = "to_m"  # to_m or to_ft
 
+# The fields added to the lab data for the from and to coordinates of each lab segment
+xyz_fields = ["from_x", "from_y", "from_z", "to_x", "to_y", "to_z"]
+
+# Number of lab rows to read, interpolate and write at a time.
+# 0 reads the whole lab table into memory at once
+lab_chunk_size = 0
+# Log the insert progress every this many lab segments
+progress_interval = 10000
+
 
 def read_lab_data_to_df(lab_table):
     # Read the lab data into a pandas DataFrame
@@ -31,20 +41,76 @@ def read_lab_data_to_df(lab_table):
         arcpy.AddError("Lab data is empty.")
         return None
 
+    return prepare_lab_df(lab_df)
+
+
+def prepare_lab_df(lab_df):
     # order the lab data by hole id and from length ascending
     lab_df = lab_df.sort_values([hole_id_field, from_len_field], ascending=[True, True])
 
     # add the fields to the lab_df: from_x, from_y, from_z, to_x, to_y, to_z
-    lab_df["from_x"] = None
-    lab_df["from_y"] = None
-    lab_df["from_z"] = None
-    lab_df["to_x"] = None
-    lab_df["to_y"] = None
-    lab_df["to_z"] = None
+    # as float columns, NaN until calculated
+    for fld in xyz_fields:
+        lab_df[fld] = np.nan
 
     return lab_df
 
 
+def read_lab_data_in_chunks(lab_table, chunk_size, text_fields=None):
+    # Read the lab data in chunks of about chunk_size rows. Tables are read ordered by hole id,
+    # csv files in file order, as they cannot be sorted without reading them whole.
+    # The rows of the last hole in a chunk are held back and sent with the next chunk,
+    # so a hole is never split across chunks when the rows of each hole are contiguous.
+    # Each row is located on its hole on its own, so the coordinates do not depend on the order,
+    # but the output of an unordered csv is only sorted by hole within each chunk.
+    # The text_fields of a csv file are read as text whatever the values of each chunk look like
+    if lab_table.lower().endswith(".csv"):
+        raw_chunks = pd.read_csv(
+            lab_table,
+            chunksize=chunk_size,
+            dtype={fld: str for fld in text_fields or []},
+        )
+    else:
+        raw_chunks = read_table_in_chunks(
+            lab_table,
+            chunk_size,
+            "ORDER BY {}, {}".format(hole_id_field, from_len_field),
+        )
+
+    held_back_df = None
+    for chunk_df in raw_chunks:
+        if held_back_df is not None:
+            chunk_df = pd.concat([held_back_df, chunk_df], ignore_index=True)
+
+        last_hole = chunk_df[hole_id_field].iloc[-1]
+        is_last_hole = (chunk_df[hole_id_field] == last_hole).to_numpy()
+        held_back_df = chunk_df[is_last_hole]
+        if is_last_hole.all():
+            continue
+
+        yield prepare_lab_df(chunk_df[~is_last_hole])
+
+    if held_back_df is not None and not held_back_df.empty:
+        yield prepare_lab_df(held_back_df)
+
+
+def read_table_in_chunks(table, chunk_size, order_by):
+    # Read a table with a search cursor into DataFrames of chunk_size rows
+    field_names = [
+        fld.name
+        for fld in arcpy.ListFields(table)
+        if fld.type not in ["OID", "Geometry", "GlobalID", "Blob", "Raster"]
+    ]
+    with arcpy.da.SearchCursor(
+        table, field_names, sql_clause=(None, order_by)
+    ) as cursor:
+        while True:
+            rows = list(itertools.islice(cursor, chunk_size))
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=field_names)
+
+
 def read_borehole_data_to_dict(borehole_lines_FC):
     borehole_sdf = GeoAccessor.from_featureclass(
         borehole_lines_FC, fields=[hole_id_field, "SHAPE@"]
@@ -65,7 +131,9 @@ def read_borehole_data_to_dict(borehole_lines_FC):
             continue
         borehole_shp_str = row["SHAPE@"].JSON
         borehole_shp_json = json.loads(borehole_shp_str)
-        borehole_dict[hole_id] = {"segments": borehole_shp_json["paths"][0]}
+        borehole_dict[hole_id] = {
+            "segments": np.asarray(borehole_shp_json["paths"][0], dtype=np.float64)
+        }
 
     return borehole_dict
 
@@ -126,6 +194,14 @@ def script_tool(
     # Read the Borehole feature class to a dictionary
     borehole_dict = read_borehole_data_to_dict(borehole_lines_FC)
 
+    if lab_chunk_size:
+        # Stream the lab data in chunks against the borehole index
+        stream_lab_segments_to_fc(
+            borehole_dict, lab_table, out_Lab_segment_Lines_FC, lab_chunk_size
+        )
+        del borehole_dict
+        return
+
     # Read the lab data into a pandas DataFrame
     lab_df = read_lab_data_to_df(lab_table)
     if lab_df is None or lab_df.empty:
@@ -144,108 +220,64 @@ def save_lab_segments_to_fc(lab_df, out_Lab_segment_Lines_FC, hole_id_field):
     # Add shape field to the lab_df
     lab_df["SHAPE@"] = None
 
-    # loop through the columns in lab_df and add them to the feature class
-    fields_in_df = lab_df.columns.tolist()
-
-    # loop through fields_in_df and add them to the feature class
-    arcpy.AddMessage("\nAdding fields to the feature class...")
-    for fld in fields_in_df:
-        field_name = fld
-        dtype = lab_df[fld].dtype
-        field_type = "TEXT"
-        max_length = 255  # default
-
-        if pd.api.types.is_integer_dtype(dtype):
-            field_type = "LONG"
-        elif pd.api.types.is_float_dtype(dtype):
-            field_type = "DOUBLE"
-        elif pd.api.types.is_datetime64_any_dtype(dtype):
-            field_type = "DATE"
-        elif pd.api.types.is_bool_dtype(dtype):
-            field_type = "TEXT"
-            max_length = 5
-        else:
-            field_type = "TEXT"
-            if lab_df[fld].dtype == "object" or lab_df[fld].dtype == "string":
-                try:
-                    max_length = int(lab_df[fld].str.len().max() or 0) + 32
-                except Exception:
-                    max_length = 255
-
-        arcpy.AddMessage(f"Adding field {field_name} of type {field_type}")
-        # add the field to the feature class
-        if fld != "SHAPE@":
-            if field_type == "TEXT":
-                arcpy.AddField_management(
-                    out_Lab_segment_Lines_FC,
-                    field_name,
-                    field_type,
-                    field_length=max_length,
-                )
-            else:
-                arcpy.AddField_management(
-                    out_Lab_segment_Lines_FC, field_name, field_type
-                )
+    fields_in_df = add_lab_segment_fields(
+        build_lab_segment_schema(lab_df), out_Lab_segment_Lines_FC
+    )
 
     # Saving the sdf directly to the feature class loses the Z geometry
-    # so we need to insert the rows one by one to preserve the Z values
-    ins_cursor = arcpy.da.InsertCursor(out_Lab_segment_Lines_FC, fields_in_df)
+    # so we need to insert the rows through a cursor to preserve the Z values
+    ins_cursor = arcpy.da.InsertCursor(
+        out_Lab_segment_Lines_FC, lab_segment_cursor_fields(fields_in_df)
+    )
     arcpy.AddMessage("\nInserting rows into the feature class...")
-    # loop through the lab_df and create the lines and insert them into the feature class
-    previous_holeID = None
-    for index, row in lab_df.iterrows():
-        holeID = row[hole_id_field]
-        # Check if the holeID is the same as the previous one
-        if previous_holeID is None:
-            previous_holeID = holeID
-            arcpy.AddMessage(f"Inserting rows for hole {holeID}...")
-        elif previous_holeID != holeID:
-            arcpy.AddMessage(f"Inserting rows for hole {holeID}...")
-            previous_holeID = holeID
-
-        from_len = row[from_len_field]
-        from_x = row["from_x"]
-        from_y = row["from_y"]
-        from_z = row["from_z"]
-        to_len = row[to_len_field]
-        to_x = row["to_x"]
-        to_y = row["to_y"]
-        to_z = row["to_z"]
-
-        if (
-            from_x is None
-            or from_y is None
-            or from_z is None
-            or to_x is None
-            or to_y is None
-            or to_z is None
-        ):
-            arcpy.AddWarning(
-                f"Skipping hole ID {holeID} length {from_len}-{to_len} due to missing coordinates: "
-                f"from_x: {from_x}, from_y: {from_y}, from_z: {from_z}, "
-                f"to_x: {to_x}, to_y: {to_y}, to_z: {to_z}"
+    insert_lab_segments(ins_cursor, lab_df, fields_in_df)
+    del ins_cursor
+
+    arcpy.AddMessage(f"Lab segment lines created in {out_Lab_segment_Lines_FC}")
+    arcpy.SetParameterAsText(2, out_Lab_segment_Lines_FC)
+
+
+def stream_lab_segments_to_fc(
+    borehole_dict, lab_table, out_Lab_segment_Lines_FC, chunk_size
+):
+    # Read, interpolate and write the lab data one chunk at a time,
+    # so only one chunk of lab rows is held in memory.
+    # The fields are defined from the lab table, as no single chunk shows all the values of a column.
+    # Unlike the non-streaming mode, the rows are written in the order of read_lab_data_in_chunks
+    field_descriptions = build_lab_table_schema(lab_table)
+    text_fields = [
+        field_name
+        for field_name, field_type, field_alias, field_length in field_descriptions
+        if field_type == "TEXT"
+    ]
+
+    ins_cursor = None
+    fields_in_df = None
+    num_rows = 0
+    for lab_df in read_lab_data_in_chunks(lab_table, chunk_size, text_fields):
+        check_lab_chunk_columns(lab_df, field_descriptions)
+        calculate_lab_segments(borehole_dict, lab_df)
+        lab_df["SHAPE@"] = None
+
+        if ins_cursor is None:
+            fields_in_df = add_lab_segment_fields(
+                field_descriptions, out_Lab_segment_Lines_FC
             )
-            pLine = None
-        else:
-            # create the polyline geometry
-            pLine = arcpy.Polyline(
-                arcpy.Array(
-                    [
-                        arcpy.Point(from_x, from_y, from_z, 0),
-                        arcpy.Point(to_x, to_y, to_z, to_len - from_len),
-                    ]
-                ),
-                spatial_reference,
-                True,
-                True,
+            ins_cursor = arcpy.da.InsertCursor(
+                out_Lab_segment_Lines_FC, lab_segment_cursor_fields(fields_in_df)
             )
+            arcpy.AddMessage("\nInserting rows into the feature class...")
 
-        # Convert row to list and set the SHAPE@ field to pLine if present
-        row_list = list(row)
-        if "SHAPE@" in fields_in_df:
-            shape_idx = fields_in_df.index("SHAPE@")
-            row_list[shape_idx] = pLine
-        ins_cursor.insertRow(row_list)
+        insert_lab_segments(
+            ins_cursor, lab_df.reindex(columns=fields_in_df), fields_in_df
+        )
+        num_rows += len(lab_df)
+        arcpy.AddMessage(f"Inserted {num_rows} lab segments...")
+        del lab_df
+
+    if ins_cursor is None:
+        arcpy.AddError("Lab data is empty.")
+        return
 
     del ins_cursor
 
@@ -253,45 +285,218 @@ def save_lab_segments_to_fc(lab_df, out_Lab_segment_Lines_FC, hole_id_field):
     arcpy.SetParameterAsText(2, out_Lab_segment_Lines_FC)
 
 
-def interpolate_xyz_at_m(segments, m_len, hole_id):
-    # Loop through the segments and find the segment that contains the measured length
-    for i in range(len(segments) - 1):
-        start_len = segments[i][3]
-        end_len = segments[i + 1][3]
+def check_lab_chunk_columns(lab_df, field_descriptions):
+    # Check that the columns read from the lab table match the field names of the schema.
+    # ArcGIS validates the field names of csv headers, e.g. "Cu (ppm)" is listed as "Cu__ppm_",
+    # and a renamed column would otherwise be written as an empty field
+    missing_fields = [
+        field_name
+        for field_name, *_ in field_descriptions
+        if field_name not in xyz_fields and field_name not in lab_df.columns
+    ]
+    if missing_fields:
+        message = (
+            f"Lab table columns do not match its field names: {', '.join(missing_fields)}. "
+            "Rename the columns to valid field names, or set lab_chunk_size to 0."
+        )
+        arcpy.AddError(message)
+        raise ValueError(message)
+
+
+def add_lab_segment_fields(field_descriptions, out_Lab_segment_Lines_FC):
+    # add the described fields to the feature class in one batch.
+    # Returns the cursor fields: the added fields followed by SHAPE@
+    arcpy.AddMessage("\nAdding fields to the feature class...")
+    for field_name, field_type, field_alias, field_length in field_descriptions:
+        arcpy.AddMessage(f"Adding field {field_name} of type {field_type}")
+
+    arcpy.management.AddFields(out_Lab_segment_Lines_FC, field_descriptions)
+
+    return [field_name for field_name, *_ in field_descriptions] + ["SHAPE@"]
+
+
+# AddFields field types of the ListFields field types that are copied from the lab table
+lab_table_field_types = {
+    "String": "TEXT",
+    "SmallInteger": "SHORT",
+    "Integer": "LONG",
+    "BigInteger": "BIGINTEGER",
+    "Single": "FLOAT",
+    "Double": "DOUBLE",
+    "Date": "DATE",
+    "GUID": "GUID",
+}
+
+
+def build_lab_table_schema(lab_table):
+    # Get the field descriptions [name, type, alias, length] for AddFields from the field definitions
+    # of the lab table, in the column order of read_lab_data_in_chunks, followed by the xyz fields
+    field_descriptions = []
+    for fld in arcpy.ListFields(lab_table):
+        if fld.type not in lab_table_field_types or fld.name in xyz_fields:
+            continue  # OID, Geometry, GlobalID, Blob and Raster fields are not read
+        field_type = lab_table_field_types[fld.type]
+        field_length = fld.length if field_type == "TEXT" else ""
+        field_descriptions.append([fld.name, field_type, fld.name, field_length])
+
+    field_descriptions.extend([fld, "DOUBLE", fld, ""] for fld in xyz_fields)
+    return field_descriptions
+
+
+def build_lab_segment_schema(lab_df):
+    # Infer the field type of every column in lab_df, and the length of the text fields.
+    # Returns the field descriptions [name, type, alias, length] for AddFields
+    dtypes = lab_df.dtypes.drop("SHAPE@", errors="ignore")
+    field_types = {}
+    for fld, dtype in dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            field_types[fld] = "TEXT"
+        elif pd.api.types.is_integer_dtype(dtype):
+            field_types[fld] = "LONG"
+        elif pd.api.types.is_float_dtype(dtype):
+            field_types[fld] = "DOUBLE"
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            field_types[fld] = "DATE"
+        else:
+            field_types[fld] = "TEXT"
+
+    # Measure the longest value of all object and string columns in one pass
+    text_columns = [
+        fld
+        for fld, dtype in dtypes.items()
+        if field_types[fld] == "TEXT"
+        and (pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype))
+    ]
+    text_lengths = pd.Series(255, index=text_columns)  # default
+    if text_columns:
+        try:
+            max_lengths = (
+                lab_df[text_columns]
+                .astype("string")
+                .apply(lambda col: col.str.len().max())
+            )
+            text_lengths = (max_lengths + 32).fillna(255).astype(int)
+        except Exception:
+            pass
+
+    field_descriptions = []
+    for fld in dtypes.index:
+        field_length = ""
+        if field_types[fld] == "TEXT":
+            if pd.api.types.is_bool_dtype(dtypes[fld]):
+                field_length = 5
+            else:
+                field_length = int(text_lengths.get(fld, 255))
+        field_descriptions.append([fld, field_types[fld], fld, field_length])
+
+    return field_descriptions
+
+
+def insert_lab_segments(ins_cursor, lab_df, fields_in_df):
+    # Build the two-point polylines of all lab segments in bulk, then feed the rows to the cursor as tuples.
+    # The cursor writes the SHAPE@ column with the SHAPE@JSON token, see lab_segment_cursor_fields
+    from_lens = lab_df[from_len_field].to_numpy(dtype=np.float64)
+    to_lens = lab_df[to_len_field].to_numpy(dtype=np.float64)
+    xyz = lab_df[xyz_fields].to_numpy(dtype=np.float64)
+
+    missing = np.isnan(xyz).any(axis=1)
+    for row_idx in np.flatnonzero(missing):
+        from_x, from_y, from_z, to_x, to_y, to_z = xyz[row_idx]
+        arcpy.AddWarning(
+            f"Skipping hole ID {lab_df[hole_id_field].iloc[row_idx]} length {from_lens[row_idx]}-{to_lens[row_idx]} due to missing coordinates: "
+            f"from_x: {from_x}, from_y: {from_y}, from_z: {from_z}, "
+            f"to_x: {to_x}, to_y: {to_y}, to_z: {to_z}"
+        )
+
+    # Esri JSON of each segment from (from_x, from_y, from_z, 0) to (to_x, to_y, to_z, to_len - from_len)
+    segment_json = '{{"hasZ":true,"hasM":true,"paths":[[[{!r},{!r},{!r},0],[{!r},{!r},{!r},{!r}]]]}}'
+    m_lens = (to_lens - from_lens).tolist()
+    shapes = [
+        None if is_missing else segment_json.format(*coords, m_len)
+        for is_missing, coords, m_len in zip(missing, xyz.tolist(), m_lens)
+    ]
+
+    # Write nulls as None, the cursor cannot write NaN or NaT to integer and date fields.
+    # Integer columns with nulls are read as float columns
+    null_columns = lab_df.columns[lab_df.isna().any().to_numpy()]
+    if len(null_columns) > 0:
+        lab_df = lab_df.astype({fld: object for fld in null_columns})
+        lab_df[null_columns] = lab_df[null_columns].where(
+            lab_df[null_columns].notna(), None
+        )
+
+    shape_idx = fields_in_df.index("SHAPE@")
+    num_rows = len(lab_df)
+    for i, row in enumerate(lab_df.itertuples(index=False, name=None)):
+        row_list = list(row)
+        row_list[shape_idx] = shapes[i]
+        ins_cursor.insertRow(row_list)
+
+        if (i + 1) % progress_interval == 0:
+            arcpy.AddMessage(f"Inserted {i + 1} of {num_rows} lab segments...")
+
+
+def lab_segment_cursor_fields(fields_in_df):
+    # The insert cursor fields, with the geometry written as Esri JSON
+    return ["SHAPE@JSON" if fld == "SHAPE@" else fld for fld in fields_in_df]
+
 
-        # Check if the m_len is between the start_len and end_len
-        if start_len <= m_len <= end_len:
-            # Calculate the ratio of the m_len to the segment length
-            ratio = (m_len - start_len) / (end_len - start_len)
+def interpolate_xyz_at_m(segments, m_lens, hole_id):
+    # Find the x, y, z at each of the measured lengths in m_lens along the segments [[x, y, z, m], ...]
+    # Returns an array of [x, y, z] rows, with NaN for the lengths not found in any segment
+    m_lens = np.asarray(m_lens, dtype=np.float64)
+    segment_ms = segments[:, 3]
 
-            # Interpolate the x, y, z values using the ratio
-            x = segments[i][0] + ratio * (segments[i + 1][0] - segments[i][0])
-            y = segments[i][1] + ratio * (segments[i + 1][1] - segments[i][1])
-            z = segments[i][2] + ratio * (segments[i + 1][2] - segments[i][2])
+    # Binary search for the first vertex whose m is >= the measured length.
+    # The segment ending at that vertex is the first one containing the length
+    end_idx = np.searchsorted(segment_ms, m_lens, side="left")
+    start_idx = np.clip(end_idx - 1, 0, len(segments) - 2)
+    end_idx = start_idx + 1
+    start_len = segment_ms[start_idx]
+    end_len = segment_ms[end_idx]
 
-            return x, y, z
+    # Check if the m_len is between the start_len and end_len
+    found = (start_len <= m_lens) & (m_lens <= end_len)
+
+    # Calculate the ratio of the m_len to the segment length
+    seg_len = end_len - start_len
+    ratio = np.divide(
+        m_lens - start_len, seg_len, out=np.zeros_like(m_lens), where=seg_len != 0
+    )
+
+    # Interpolate the x, y, z values using the ratio
+    xyz = segments[start_idx, :3] + ratio[:, np.newaxis] * (
+        segments[end_idx, :3] - segments[start_idx, :3]
+    )
 
     # If the m_len is not found in any segment, extend a padding to accommodate arcpy length round-off
     padding = 0.0001
-    if (
-        segments is not None
-        and end_len is not None
-        and end_len <= m_len <= end_len + padding
-    ):
-        return segments[-1][0], segments[-1][1], segments[-1][2]
+    padded = ~found & (segment_ms[-1] <= m_lens) & (m_lens <= segment_ms[-1] + padding)
+    xyz[padded] = segments[-1, :3]
+
+    not_found = ~found & ~padded
+    for m_len in m_lens[not_found]:
+        arcpy.AddWarning(f"Length {m_len} not found in any segments of {hole_id}.")
+    xyz[not_found] = np.nan
 
-    arcpy.AddWarning(f"Length {m_len} not found in any segments of {hole_id}.")
-    return None, None, None
+    return xyz
 
 
 def calculate_lab_segments(borehole_dict, lab_df):
-    # Loop through the lab data and calculate the from_x, from_y, from_z, to_x, to_y, to_z for each lab segment
+    # Calculate the from_x, from_y, from_z, to_x, to_y, to_z for each lab segment, one hole at a time
     arcpy.AddMessage("Calculating lab segment lines...")
-    for index, row in lab_df.iterrows():
-        hole_id = row[hole_id_field]
-        from_len = row[from_len_field]
-        to_len = row[to_len_field]
-
+    from_lens = lab_df[from_len_field].to_numpy(dtype=np.float64)
+    to_lens = lab_df[to_len_field].to_numpy(dtype=np.float64)
+    xyz = np.full((len(lab_df), 6), np.nan)
+
+    # Group the row positions by hole. Rows without a hole id (code -1) sort first and are skipped
+    hole_codes, hole_ids = pd.factorize(lab_df[hole_id_field])
+    row_order = np.argsort(hole_codes, kind="stable")
+    hole_counts = np.bincount(hole_codes[hole_codes >= 0], minlength=len(hole_ids))
+    hole_ends = np.count_nonzero(hole_codes < 0) + np.cumsum(hole_counts)
+    hole_starts = hole_ends - hole_counts
+
+    for hole_id, start, end in zip(hole_ids, hole_starts, hole_ends):
         # Check if the hole_id exists in the borehole_dict
         if hole_id not in borehole_dict:
             arcpy.AddWarning(f"Hole ID {hole_id} not found in borehole data.")
@@ -299,16 +504,16 @@ def calculate_lab_segments(borehole_dict, lab_df):
         else:
             segments = borehole_dict[hole_id]["segments"]
 
-        from_x, from_y, from_z = interpolate_xyz_at_m(segments, from_len, hole_id)
-        to_x, to_y, to_z = interpolate_xyz_at_m(segments, to_len, hole_id)
+        # Locate the from and to lengths of all lab intervals of the hole in one call
+        rows = row_order[start:end]
+        hole_xyz = interpolate_xyz_at_m(
+            segments, np.concatenate([from_lens[rows], to_lens[rows]]), hole_id
+        )
+        xyz[rows, :3] = hole_xyz[: len(rows)]
+        xyz[rows, 3:] = hole_xyz[len(rows) :]
 
-        # assign the values to the row
-        lab_df.at[index, "from_x"] = from_x
-        lab_df.at[index, "from_y"] = from_y
-        lab_df.at[index, "from_z"] = from_z
-        lab_df.at[index, "to_x"] = to_x
-        lab_df.at[index, "to_y"] = to_y
-        lab_df.at[index, "to_z"] = to_z
+    # assign the values to the lab_df in one step
+    lab_df[xyz_fields] = xyz
 
 
 if __name__ == "__main__":
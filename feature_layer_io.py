@@ -0,0 +1,591 @@
+import json
+import logging
+import math
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+# Shared reading and writing of hosted feature layers for the MRP scripts.
+# The run_update decorator in each script pushes its edits through push_edits.
+
+# Maximum number of edit_features requests in flight at the same time
+max_in_flight_requests = 4
+# Number of times a failed update batch is resent, waiting retry_backoff_seconds * 2^attempt between tries
+max_retries = 3
+retry_backoff_seconds = 2
+
+# Limits for adapting the batch size to the observed latency and payload size of each request
+adaptive_batch_size = True
+min_batch_size = 50
+max_batch_size = 5000
+target_batch_seconds = 10
+max_batch_bytes = 8 * 1024 * 1024
+
+# Maximum number of features per page when reading a layer
+query_page_size = 2000
+# Maximum number of objectId ranges of a layer read at the same time
+max_query_workers = 4
+
+# Messages that mean a request was rejected for the size of its payload
+payload_too_large_messages = [
+    "request entity too large",
+    "payload too large",
+    "request too large",
+    "exceeds the maximum",
+    "maximum request size",
+]
+
+
+def is_payload_too_large(error):
+    message = str(error).lower()
+    if re.search(r"\b413\b", message):  # HTTP status code
+        return True
+    return any(m in message for m in payload_too_large_messages)
+
+
+def payload_bytes(batch, sample_size=50):
+    # Estimate the JSON size of a batch of edits from a sample of its records
+    sample = [f if isinstance(f, dict) else f.as_dict for f in batch[:sample_size]]
+    if not sample:
+        return 0
+    sample_bytes = len(json.dumps(sample, default=str))
+    return int(sample_bytes * len(batch) / len(sample))
+
+
+def new_batch_state(batch_size):
+    # Batch size shared by the upload threads, adapted after every request
+    return {
+        "size": max(min_batch_size, min(batch_size, max_batch_size)),
+        "lock": threading.Lock(),
+    }
+
+
+def adapt_batch_size(batch_state, num_records, seconds, num_bytes):
+    """
+    Grow or shrink the batch size so the next requests take about target_batch_seconds
+    and stay under max_batch_bytes, changing it by at most a factor of 2 each time.
+    """
+    if num_records == 0:
+        return
+    records_per_second = num_records / max(seconds, 1e-3)
+    bytes_per_record = max(num_bytes / num_records, 1)
+    target_size = min(
+        records_per_second * target_batch_seconds, max_batch_bytes / bytes_per_record
+    )
+    with batch_state["lock"]:
+        size = batch_state["size"]
+        size = min(max(int(target_size), size // 2), size * 2)
+        batch_state["size"] = max(min_batch_size, min(size, max_batch_size))
+
+
+def shrink_batch_size(batch_state, rejected_size):
+    # A request was rejected for its size, keep later batches under half of it
+    with batch_state["lock"]:
+        batch_state["size"] = max(
+            min_batch_size, min(batch_state["size"], rejected_size // 2)
+        )
+
+
+def edit_batch(layer, batch, operation, use_global_ids, logger, batch_state=None):
+    """
+    Send one batch of edits to the layer, splitting it if it is too large.
+    Failed updates are retried with backoff. Failed adds are not, as they may have been committed.
+
+    Returns:
+    tuple: (number of succeeded records, number of failed records)
+    """
+    keyStr = "updateResults" if operation == "update" else "addResults"
+
+    for attempt in range(max_retries + 1):
+        try:
+            batch_start = time.time()
+            if operation == "update":
+                edit_result = layer.edit_features(
+                    updates=batch, use_global_ids=use_global_ids
+                )
+            else:  # add
+                edit_result = layer.edit_features(adds=batch, rollback_on_failure=True)
+            elapsed = max(time.time() - batch_start, 1e-6)
+            if batch_state is not None:
+                adapt_batch_size(batch_state, len(batch), elapsed, payload_bytes(batch))
+
+            totalRecords = len(edit_result[keyStr])
+            failed_records = [d for d in edit_result[keyStr] if d["success"] == False]
+            succeeded_records = totalRecords - len(failed_records)
+            logger.info(
+                "\tBatch edit results: {} of {} succeeded in {:.1f} seconds ({:.0f} records/s)".format(
+                    succeeded_records, totalRecords, elapsed, totalRecords / elapsed
+                )
+            )
+            if failed_records:
+                logger.info("\tFailed records: {}".format(failed_records))
+
+            return succeeded_records, len(failed_records)
+
+        except Exception as e:
+            if is_payload_too_large(e) and len(batch) > 1:
+                half = len(batch) // 2
+                if batch_state is not None:
+                    shrink_batch_size(batch_state, len(batch))
+                logger.info(
+                    "\tBatch of {} records rejected for its size, splitting it in two".format(
+                        len(batch)
+                    )
+                )
+                s1, f1 = edit_batch(
+                    layer, batch[:half], operation, use_global_ids, logger, batch_state
+                )
+                s2, f2 = edit_batch(
+                    layer, batch[half:], operation, use_global_ids, logger, batch_state
+                )
+                return s1 + s2, f1 + f2
+
+            if operation != "update":
+                # The adds may have been committed before the request failed, for example
+                # on a timeout, and sending them again would duplicate the features
+                logger.info(
+                    "\tBatch add of {} records failed and is not retried, check the layer for partially added features".format(
+                        len(batch)
+                    )
+                )
+                logger.info(traceback.format_exc())
+                break
+            elif attempt < max_retries:
+                wait_seconds = retry_backoff_seconds * 2**attempt
+                logger.info(
+                    "\tBatch edit of {} records failed, retrying in {} seconds: {}".format(
+                        len(batch), wait_seconds, e
+                    )
+                )
+                time.sleep(wait_seconds)
+            else:
+                logger.info(traceback.format_exc())
+
+    return 0, len(batch)
+
+
+def push_edits(
+    layer,
+    edit_list,
+    operation="update",
+    batch_size=1000,
+    use_global_ids=False,
+    max_workers=None,
+    logger=None,
+    adaptive=None,
+):
+    """
+    Push a list of edits to a feature layer in batches, with several edit_features requests in flight.
+
+    Parameters:
+    layer (FeatureLayer or Table): Layer to edit
+    edit_list (list): Features to update or add
+    operation (str): "update", or anything else to add
+    batch_size (int): Number of features per edit_features request
+    use_global_ids (bool): Identify updated features by global id
+    max_workers (int): Maximum number of requests in flight, max_in_flight_requests by default
+    logger (Logger): Logger for the batch results
+    adaptive (bool): Adapt the batch size to the observed latency and payload size,
+        adaptive_batch_size by default. batch_size is then the size of the first batches.
+
+    Returns:
+    tuple: (number of succeeded records, number of failed records)
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    if not batch_size:
+        batch_size = 1000
+    if not max_workers:
+        max_workers = max_in_flight_requests
+    if adaptive is None:
+        adaptive = adaptive_batch_size
+    batch_state = new_batch_state(batch_size) if adaptive else None
+
+    num_total_records = len(edit_list)
+    num_succeeded_records = 0
+    num_failed_records = 0
+    start = time.time()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = set()
+            position = 0
+            while position < num_total_records or in_flight:
+                # Take the next batches while there is room for more requests
+                while position < num_total_records and len(in_flight) < max_workers:
+                    size = batch_state["size"] if batch_state else batch_size
+                    update_set = edit_list[position : position + size]
+                    position += size
+                    in_flight.add(
+                        executor.submit(
+                            edit_batch,
+                            layer,
+                            update_set,
+                            operation,
+                            use_global_ids,
+                            logger,
+                            batch_state,
+                        )
+                    )
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    succeeded_records, failed_records = future.result()
+                    num_succeeded_records += succeeded_records
+                    num_failed_records += failed_records
+    except Exception:
+        logger.info(traceback.format_exc())
+    finally:
+        elapsed = max(time.time() - start, 1e-6)
+        logger.info(
+            " \n\tSummary: Total records {}, succeeded records {}, failed records {}, {:.0f} records/s".format(
+                num_total_records,
+                num_succeeded_records,
+                num_failed_records,
+                num_total_records / elapsed,
+            )
+        )
+
+    return num_succeeded_records, num_failed_records
+
+
+def query_with_retry(layer, logger, **query_kwargs):
+    # Query the layer, retrying failed requests with backoff
+    for attempt in range(max_retries + 1):
+        try:
+            return layer.query(**query_kwargs)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            wait_seconds = retry_backoff_seconds * 2**attempt
+            logger.info(
+                "\tQuery failed, retrying in {} seconds: {}".format(wait_seconds, e)
+            )
+            time.sleep(wait_seconds)
+
+
+def iter_feature_pages(
+    layer,
+    where="1=1",
+    out_fields="*",
+    return_geometry=False,
+    page_size=None,
+    start_oid=None,
+    progress=None,
+    logger=None,
+    max_workers=None,
+    **query_kwargs
+):
+    """
+    Read a layer one page of features at a time, in objectId order.
+
+    Each page is the next window of objectIds after the last one read, so memory stays
+    flat however large the layer is. The next page is fetched in the background while
+    the current one is processed. With more than one worker, the objectId domain is split
+    into ranges that are read at the same time, and their pages are still yielded in order.
+
+    Parameters:
+    layer (FeatureLayer or Table): Layer to read
+    where (str): Where clause of the features to read
+    out_fields (str or list): Fields to read, the objectId field is always added
+    return_geometry (bool): Read the geometries too
+    page_size (int): Maximum number of features per page, query_page_size by default,
+        and no more than the layer's maxRecordCount
+    start_oid (int): Read the features after this objectId, to resume a failed read
+    progress (dict): If given, progress["last_oid"] holds the last objectId of the pages
+        already processed, to pass as start_oid when resuming
+    logger (Logger): Logger for the retries
+    max_workers (int): Maximum number of objectId ranges read at the same time,
+        max_query_workers by default, 1 to read the pages one after another
+
+    Yields:
+    FeatureSet: the features of each page
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    if not page_size:
+        page_size = query_page_size
+    max_record_count = layer.properties.get("maxRecordCount")
+    if max_record_count:
+        page_size = min(page_size, max_record_count)
+
+    oid_field = layer.properties.objectIdField
+    if isinstance(out_fields, str):
+        out_fields = [f.strip() for f in out_fields.split(",")]
+    if "*" not in out_fields and oid_field not in out_fields:
+        out_fields = [oid_field] + list(out_fields)
+    if not where:
+        where = "1=1"
+
+    if not max_workers:
+        max_workers = max_query_workers
+    if max_workers > 1:
+        oid_ranges = split_oid_ranges(
+            layer, where, oid_field, page_size, start_oid, logger
+        )
+        if oid_ranges is not None:
+            yield from iter_oid_range_pages(
+                layer,
+                where,
+                out_fields,
+                return_geometry,
+                page_size,
+                oid_ranges,
+                max_workers,
+                progress,
+                logger,
+                **query_kwargs
+            )
+            return
+
+    def fetch_page(after_oid):
+        page_where = where
+        if after_oid is not None:
+            page_where = "({}) AND {} > {}".format(where, oid_field, after_oid)
+        return query_with_retry(
+            layer,
+            logger,
+            where=page_where,
+            out_fields=",".join(out_fields),
+            return_geometry=return_geometry,
+            order_by_fields="{} ASC".format(oid_field),
+            result_record_count=page_size,
+            **query_kwargs
+        )
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(fetch_page, start_oid)
+        while True:
+            page = next_page.result()
+            if len(page.features) == 0:
+                return
+
+            # Start fetching the next page before handing this one over
+            last_oid = page.features[-1].attributes[oid_field]
+            next_page = executor.submit(fetch_page, last_oid)
+            yield page
+            if progress is not None:
+                progress["last_oid"] = last_oid
+
+
+def split_oid_ranges(layer, where, oid_field, page_size, start_oid=None, logger=None):
+    """
+    Split the objectIds of the features matching the where clause into ranges of about
+    page_size features each, from the count and the lowest and highest objectIds.
+    The ranges are even, iter_oid_range_pages splits further the ones holding more features.
+
+    Returns:
+    list: (first objectId, last objectId) of each range, or None if the layer cannot
+        return the statistics
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    out_statistics = [
+        {
+            "statisticType": statistic,
+            "onStatisticField": oid_field,
+            "outStatisticFieldName": "{}_oid".format(statistic),
+        }
+        for statistic in ["count", "min", "max"]
+    ]
+    try:
+        # A single try without the retries, as services without statistics support
+        # would only fail again after the backoff
+        stats = layer.query(
+            where=where,
+            out_statistics=out_statistics,
+            return_geometry=False,
+        )
+        # The case of the statistic field names varies between services
+        attributes = {k.lower(): v for k, v in stats.features[0].attributes.items()}
+        num_features = attributes["count_oid"]
+        min_oid = attributes["min_oid"]
+        max_oid = attributes["max_oid"]
+    except Exception as e:
+        logger.info(
+            "\tCould not get the objectId statistics, reading the pages one after another: {}".format(
+                e
+            )
+        )
+        return None
+
+    if not num_features:
+        return []
+    if start_oid is not None:
+        min_oid = max(min_oid, start_oid + 1)
+    if min_oid > max_oid:
+        return []
+
+    num_ranges = max(1, math.ceil(num_features / page_size))
+    range_size = max(1, math.ceil((max_oid - min_oid + 1) / num_ranges))
+    return [
+        (first_oid, min(first_oid + range_size - 1, max_oid))
+        for first_oid in range(min_oid, max_oid + 1, range_size)
+    ]
+
+
+def iter_oid_range_pages(
+    layer,
+    where,
+    out_fields,
+    return_geometry,
+    page_size,
+    oid_ranges,
+    max_workers,
+    progress=None,
+    logger=None,
+    **query_kwargs
+):
+    """
+    Read the objectId ranges of a layer with up to max_workers queries at the same time,
+    and yield their pages in objectId order.
+
+    Each query reads one page of a range, and a range is read until a page comes back empty,
+    as a server may return fewer features than asked for. When the first page of a range is
+    full, the rest of the range is split by the density of objectIds seen on that page, so a
+    range holding many more features than expected is still read in parallel. At most
+    2 * max_workers pages, plus the next page of the current range, are held in memory at a time.
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    max_record_count = layer.properties.get("maxRecordCount")
+    if max_record_count:
+        page_size = min(page_size, max_record_count)
+    oid_field = layer.properties.objectIdField
+    max_pending = 2 * max_workers
+
+    def fetch_page(after_oid, last_oid):
+        return query_with_retry(
+            layer,
+            logger,
+            where="({}) AND {} > {} AND {} <= {}".format(
+                where, oid_field, after_oid, oid_field, last_oid
+            ),
+            out_fields=",".join(out_fields),
+            return_geometry=return_geometry,
+            order_by_fields="{} ASC".format(oid_field),
+            result_record_count=page_size,
+            **query_kwargs
+        )
+
+    # [objectId read up to, last objectId of the range, future of its next page or None,
+    # whether nothing has been read from it yet], in objectId order
+    ranges = deque(
+        [first_oid - 1, last_oid, None, True] for first_oid, last_oid in oid_ranges
+    )
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while ranges:
+            # Keep the pool busy with the next ranges. The current range always has its page requested
+            num_pending = 0
+            for r in ranges:
+                if r[2] is None and (num_pending < max_pending or r is ranges[0]):
+                    r[2] = executor.submit(fetch_page, r[0], r[1])
+                if r[2] is not None:
+                    num_pending += 1
+                if num_pending >= max_pending:
+                    break
+
+            head = ranges[0]
+            after_oid, last_oid, future, is_first_page = head
+            page = future.result()
+            head[2] = None
+            head[3] = False
+            if len(page.features) == 0:
+                ranges.popleft()
+            else:
+                read_oid = page.features[-1].attributes[oid_field]
+                head[0] = read_oid
+                if read_oid >= last_oid:
+                    ranges.popleft()
+                elif is_first_page and len(page.features) >= page_size:
+                    # First page of the range: split the rest of it by the objectId density of the page
+                    estimate = (
+                        page_size * (last_oid - read_oid) / (read_oid - after_oid)
+                    )
+                    num_splits = min(
+                        max(1, math.ceil(estimate / page_size)), max_pending
+                    )
+                    if num_splits > 1:
+                        ranges.popleft()
+                        split_size = math.ceil((last_oid - read_oid) / num_splits)
+                        ranges.extendleft(
+                            reversed(
+                                [
+                                    [
+                                        start_oid,
+                                        min(start_oid + split_size, last_oid),
+                                        None,
+                                        True,
+                                    ]
+                                    for start_oid in range(
+                                        read_oid, last_oid, split_size
+                                    )
+                                ]
+                            )
+                        )
+
+            if len(page.features) > 0:
+                yield page
+            if progress is not None:
+                if ranges:
+                    # Every objectId up to where the current range has been read is processed
+                    progress["last_oid"] = ranges[0][0]
+                else:
+                    progress["last_oid"] = last_oid
+    finally:
+        # Leaving early, do not wait for the pages that are not being read yet
+        for r in ranges:
+            if r[2] is not None:
+                r[2].cancel()
+        executor.shutdown(wait=True)
+
+
+def column_array(values):
+    # Numeric columns become float64 with NaN for nulls, or int64 when there are no nulls.
+    # Other columns are kept as arrays of Python objects
+    column = np.array(values)
+    if column.dtype == object and all(
+        v is None or isinstance(v, (int, float)) for v in values
+    ):
+        column = np.array(values, dtype=np.float64)
+    return column
+
+
+def iter_column_batches(
+    layer, where="1=1", out_fields="*", max_workers=None, logger=None, **page_kwargs
+):
+    """
+    Read a layer as batches of NumPy columns, in objectId order.
+    The pages are read as in iter_feature_pages, by default with max_query_workers
+    objectId ranges at the same time.
+
+    Parameters:
+    layer (FeatureLayer or Table): Layer to read
+    where (str): Where clause of the features to read
+    out_fields (list): Fields to read, the objectId field is always added
+    max_workers (int): Maximum number of objectId ranges read at the same time
+    logger (Logger): Logger for the retries
+
+    Yields:
+    dict: field name: array of the values of each page
+    """
+    for page in iter_feature_pages(
+        layer,
+        where=where,
+        out_fields=out_fields,
+        max_workers=max_workers,
+        logger=logger,
+        **page_kwargs
+    ):
+        features = page.features
+        fields = features[0].attributes.keys()
+        yield {
+            fld: column_array([f.attributes.get(fld) for f in features])
+            for fld in fields
+        }
@@ -11,9 +11,11 @@ import json
 import os
 import math
 import arcpy
-import pandas as pd
+import numpy as np
 from arcgis.geometry import Polygon, Geometry, areas_and_lengths
 from arcgis.geometry import Point, buffer, LengthUnits, AreaUnits
+import feature_layer_io
+import raster_tile_cache
 
 logger = None
 batch_size = 1000
@@ -62,85 +64,28 @@ def get_logger(l_dir, t_filename, s_time):
 
 def run_update(the_func):
     def wrapper(*args, **kwargs):
-        global batch_size
         global num_failed_records
         global num_succeeded_records
 
         # Run Function & Collect Update List
         edit_list = the_func(*args)
-        num_total_records = len(edit_list)
-        num_succeeded_records = 0
-        num_failed_records = 0
 
         if edit_list:
             operation = kwargs.get("operation", None)
-            # Batch Update List Into Smaller Sets
-            # batch_size = kwargs.get("batch", None)
-            use_global_ids = kwargs.get("use_global_ids", False)
-            if not batch_size:
-                batch_size = 1000
-            update_sets = [
-                edit_list[x : x + batch_size]
-                for x in range(0, len(edit_list), batch_size)
-            ]
-            # logger.info("\nProcessing {} Batch(es)\n".format(len(update_sets)))
-
-            # Push Edit Batches
-            try:
-                for update_set in update_sets:
-                    try:
-                        keyStr = ""
-                        if operation == "update":
-                            edit_result = kwargs.get("update").edit_features(
-                                updates=update_set, use_global_ids=use_global_ids
-                            )
-                            keyStr = "updateResults"
-                        else:  # add
-                            edit_result = kwargs.get("add").edit_features(
-                                adds=update_set
-                            )
-                            keyStr = "addResults"
-
-                        totalRecords = len(edit_result[keyStr])
-
-                        succeeded_records = len(
-                            list(
-                                filter(
-                                    lambda d: d["success"] == True,
-                                    edit_result[keyStr],
-                                )
-                            )
-                        )
-                        logger.info(
-                            "\tBatch edit results: {} of {} succeeded".format(
-                                succeeded_records, totalRecords
-                            )
-                        )
-                        num_succeeded_records = (
-                            num_succeeded_records + succeeded_records
-                        )
-                        if totalRecords > succeeded_records:
-                            failed_records = list(
-                                filter(
-                                    lambda d: d["success"] == False,
-                                    edit_result[keyStr],
-                                )
-                            )
-                            num_failed_records = num_failed_records + len(
-                                failed_records
-                            )
-                            logger.info("\Failed records: {}".format(failed_records))
-
-                    except Exception:
-                        logger.info(traceback.format_exc())
-            except Exception:
-                logger.info(traceback.format_exc())
-            finally:
-                logger.info(
-                    " \n\tSummary: Total records {}, succeeded records {}, failed records {}".format(
-                        num_total_records, num_succeeded_records, num_failed_records
-                    )
-                )
+            if operation == "update":
+                edit_layer = kwargs.get("update")
+            else:  # add
+                edit_layer = kwargs.get("add")
+
+            # Push Edit Batches, several requests in flight at a time
+            num_succeeded_records, num_failed_records = feature_layer_io.push_edits(
+                edit_layer,
+                edit_list,
+                operation=operation,
+                batch_size=batch_size,
+                use_global_ids=kwargs.get("use_global_ids", False),
+                logger=logger,
+            )
 
         else:
             logger.info("Returned List Was Empty. No Edits Performed.")
@@ -279,9 +224,41 @@ def add_flag_fields(taskItem, taskLyr):
         logger.info("\tAll fields already exist in the layer")
 
 
-def flag_rounded(taskItem, taskLyr, task):
-    global field_to_calc_x, field_to_calc_y, field_to_calc_corner, field_to_calc_landforms
-    logger.info("\n ------- Flagging points with lat/long rounded ------- \n")
+def rounded_rule(lats, lons):
+    # check if the latitide_field and longitude_field are rounded to the nearest integer, the nearest minute, or the nearest 30 second
+    return {
+        field_to_calc_y: check_rounded_array(lats),
+        field_to_calc_x: check_rounded_array(lons),
+    }
+
+
+def corners_rule(lats, lons):
+    # check if the points are snapped to the corners of the quadrangle maps
+    return {field_to_calc_corner: check_cornered_array(lats, lons)}
+
+
+# Point rules evaluated on the latitude and longitude arrays of each page of a single query.
+# Each rule returns {flag field: flag array} and is named as in the rules_to_run config
+point_rules = {
+    "flag_rounded": {
+        "title": "Flagging points with lat/long rounded",
+        "fields": [field_to_calc_y, field_to_calc_x],
+        "calc": rounded_rule,
+    },
+    "flag_corners": {
+        "title": "Flagging points snapped to the corners of USGS 3.5' topographic quadrangle maps",
+        "fields": [field_to_calc_corner],
+        "calc": corners_rule,
+    },
+}
+
+
+def flag_points(taskItem, taskLyr, task, rule_names):
+    logger.info(
+        "\n ------- Flagging points with rules: {} ------- \n".format(
+            ", ".join(rule_names)
+        )
+    )
     latitide_field = task["latitide_field"]
     longitude_field = task["longitude_field"]
     where = None
@@ -292,56 +269,64 @@ def flag_rounded(taskItem, taskLyr, task):
         where = "1=1"
 
     oid_field = taskLyr.properties.objectIdField
+    flag_fields = [fld for name in rule_names for fld in point_rules[name]["fields"]]
 
-    # Query the layer to get all values of the latitide_field and longitude_field
-    query_result = taskLyr.query(
-        where=where,
-        out_fields="{},{},{}".format(oid_field, latitide_field, longitude_field),
-        return_geometry=False,
-        return_all_records=True,
-    )
+    for name in rule_names:
+        logger.info("\t{}".format(point_rules[name]["title"]))
 
+    # Read the layer once, as batches of columns, to get the values of the latitide_field and longitude_field,
+    # and the current flags. Only the updates of the flags that changed are kept
     list_to_update = []
-    num_flagged_x = 0
-    num_flagged_y = 0
-    num_flagged = 0
-    # for each feature in the query result, check if the latitide_field and longitude_field are rounded to the nearest integer, the nearest minute, or the nearest 30 second
-    for f in query_result.features:
-        new_attributes = {oid_field: f.attributes[oid_field]}
-        lat = f.attributes[latitide_field]
-        lon = f.attributes[longitude_field]
-        if lat is None:
-            new_attributes[field_to_calc_y] = -1
-        else:
-            new_attributes[field_to_calc_y] = check_rounded(lat)
-
-        if lon is None:
-            new_attributes[field_to_calc_x] = -1
-        else:
-            new_attributes[field_to_calc_x] = check_rounded(lon)
-
-        if new_attributes[field_to_calc_y] != 0:
-            num_flagged_y += 1
-
-        if new_attributes[field_to_calc_x] != 0:
-            num_flagged_x += 1
-
-        if new_attributes[field_to_calc_x] > 0 or new_attributes[field_to_calc_y] > 0:
-            num_flagged += 1
-
-        list_to_update.append({"attributes": new_attributes})
+    num_flagged_by_field = {fld: 0 for fld in flag_fields}
+    change_counts = {"unchanged": 0, "changed": 0, "null": 0}
+    for batch in feature_layer_io.iter_column_batches(
+        taskLyr,
+        where=where,
+        out_fields=[oid_field, latitide_field, longitude_field] + flag_fields,
+        logger=logger,
+    ):
+        lats = batch[latitide_field].astype(np.float64)
+        lons = batch[longitude_field].astype(np.float64)
+
+        # Evaluate every rule on the same arrays
+        flags = {}
+        for name in rule_names:
+            flags.update(point_rules[name]["calc"](lats, lons))
+        for fld in flag_fields:
+            num_flagged_by_field[fld] += int(np.count_nonzero(flags[fld]))
+
+        # Compare with the flags stored in the layer
+        changed = find_changed_flags(batch, flags, flag_fields, change_counts)
+
+        # Merge the flags of all the rules into one update per changed feature
+        flag_values = [flags[fld][changed].tolist() for fld in flag_fields]
+        list_to_update.extend(
+            {
+                "attributes": {
+                    oid_field: oid,
+                    **dict(zip(flag_fields, values)),
+                }
+            }
+            for oid, values in zip(
+                batch[oid_field][changed].tolist(), zip(*flag_values)
+            )
+        )
 
-    logger.info("\tNumber of flagged longitude: {}".format(num_flagged_x))
-    logger.info("\tNumber of flagged latitude: {}".format(num_flagged_y))
-    logger.info("\tNumber of flagged points: {}".format(num_flagged))
+    for fld in flag_fields:
+        logger.info("\tNumber of flagged {}: {}".format(fld, num_flagged_by_field[fld]))
+    logger.info(
+        "\tUnchanged flags: {}, changed flags: {}, of which previously null: {}".format(
+            change_counts["unchanged"], change_counts["changed"], change_counts["null"]
+        )
+    )
+    num_flagged = sum(num_flagged_by_field.values())
 
-    if num_flagged == 0:
+    if len(list_to_update) == 0:
+        logger.info("\tAll flags are up to date")
+    elif num_flagged == 0:
         calc_field_response = taskLyr.calculate(
             where=where,
-            calc_expression=[
-                {"field": field_to_calc_x, "sqlExpression": 0},
-                {"field": field_to_calc_y, "sqlExpression": 0},
-            ],
+            calc_expression=[{"field": fld, "sqlExpression": 0} for fld in flag_fields],
         )
         logger.info("Calculate field response: {}".format(calc_field_response))
     else:
@@ -355,35 +340,50 @@ def flag_rounded(taskItem, taskLyr, task):
         )
 
 
-# check if the latitide_field and longitude_field are rounded to the nearest integer, the nearest minute, or the nearest 30 second
-def check_rounded(v):
-    if v is None:
-        return 0
-
+def find_changed_flags(current_flags, new_flags, flag_fields, counts):
+    # Compare the new flag arrays with the flags stored in the layer, both {field: array}.
+    # Null stored flags are always updated. The counts of unchanged, changed, and previously
+    # null features are added to the counts dict.
+    # Returns the boolean array of the features with a changed flag
+    num_features = len(new_flags[flag_fields[0]])
+    changed = np.zeros(num_features, dtype=bool)
+    null = np.zeros(num_features, dtype=bool)
+    for fld in flag_fields:
+        current = np.asarray(current_flags[fld], dtype=np.float64)
+        null |= np.isnan(current)
+        changed |= np.isnan(current) | (current != new_flags[fld])
+
+    counts["unchanged"] += int(np.count_nonzero(~changed))
+    counts["changed"] += int(np.count_nonzero(changed))
+    counts["null"] += int(np.count_nonzero(null))
+    return changed
+
+
+# check if the values are rounded to the nearest integer, the nearest minute, or the nearest 30 second:
+# 1, 2, or 3 for values rounded to the degree, minute, or 30 seconds, 0 for values not rounded, and -1 for null values
+def check_rounded_array(values):
+    values = np.asarray(values, dtype=np.float64)
     tolerance_min = 0.0000001
     tolerance_max = 1 - tolerance_min
-    # Extract the fractional degrees
-    fractional_degrees = abs(v) % 1
 
-    # Check if the value is rounded to the nearest degree
-    if fractional_degrees < tolerance_min or fractional_degrees > tolerance_max:
-        return 1
-    else:
-        # Convert the fractional degrees into minutes (1 degree = 60 minutes)
-        minutes = fractional_degrees * 60
-        fractional_minutes = minutes % 1
-        # Check if the minutes value is close to an integer (within a small tolerance)
-        if fractional_minutes < tolerance_min or fractional_minutes > tolerance_max:
-            return 2
-        else:
-            # Check if the minutes value is close to a multiple of 0.5 (within a small tolerance)
-            fractional_half_minutes = (minutes * 2) % 1
-            if (
-                fractional_half_minutes < tolerance_min
-                or fractional_half_minutes > tolerance_max
-            ):
-                return 3
-    return 0
+    fractional_degrees = np.abs(values) % 1
+    minutes = fractional_degrees * 60
+    fractional_minutes = minutes % 1
+    fractional_half_minutes = (minutes * 2) % 1
+
+    flags = np.zeros(values.shape, dtype=np.int8)
+    flags[
+        (fractional_half_minutes < tolerance_min)
+        | (fractional_half_minutes > tolerance_max)
+    ] = 3
+    flags[
+        (fractional_minutes < tolerance_min) | (fractional_minutes > tolerance_max)
+    ] = 2
+    flags[
+        (fractional_degrees < tolerance_min) | (fractional_degrees > tolerance_max)
+    ] = 1
+    flags[np.isnan(values)] = -1
+    return flags
 
 
 @run_update
@@ -395,138 +395,104 @@ def save_to_featurelayer(process_list):
     return process_list
 
 
-def flag_cornered(taskItem, taskLyr, task):
-    global field_to_calc_x, field_to_calc_y, field_to_calc_corner, field_to_calc_landforms
-    logger.info(
-        "\n ------- Flagging points snapped to the corners of USGS 3.5' topographic quadrangle maps ------- \n"
-    )
-    latitide_field = task["latitide_field"]
-    longitude_field = task["longitude_field"]
-
-    where = None
-    if "where" in task:
-        where = task["where"]
-
-    if where is None or where == "":
-        where = "1=1"
-
-    oid_field = taskLyr.properties.objectIdField
-
-    # Query the layer to get all values of the latitide_field and longitude_field
-    query_result = taskLyr.query(
-        where=where,
-        out_fields="{},{},{}".format(oid_field, latitide_field, longitude_field),
-        return_geometry=False,
-        return_all_records=True,
-    )
-
-    list_to_update = []
-    num_flagged = 0
-    # for each feature in the query result, check if the latitide_field and longitude_field are rounded to the nearest integer, the nearest minute, or the nearest 30 second
-    for f in query_result.features:
-        new_attributes = {oid_field: f.attributes[oid_field]}
-        lat = f.attributes[latitide_field]
-        lon = f.attributes[longitude_field]
-
-        if lat is None or lon is None:
-            new_attributes[field_to_calc_corner] = -1
-        else:
-            new_attributes[field_to_calc_corner] = (
-                1
-                if (check_cornered(lat, False) == 1 and check_cornered(lon, True))
-                else 0
-            )
-
-        if new_attributes[field_to_calc_corner] != 0:
-            num_flagged += 1
-
-        list_to_update.append({"attributes": new_attributes})
-
-    logger.info("\tNumber of flagged points: {}".format(num_flagged))
-
-    if num_flagged == 0:
-        calc_field_response = taskLyr.calculate(
-            where=where,
-            calc_expression={"field": field_to_calc_corner, "sqlExpression": 0},
-        )
-        logger.info("Calculate field response: {}".format(calc_field_response))
-    else:
-        save_to_featurelayer(
-            list_to_update,
-            update=taskLyr,
-            track=None,
-            item=taskItem,
-            operation="update",
-            use_global_ids=False,
-        )
-
-
 def flag_landforms(taskItem, taskLyr, task):
     global field_to_calc_x, field_to_calc_y, field_to_calc_corner, field_to_calc_landforms
     logger.info("\n ------- Flagging points with landforms ------- \n")
     field_to_calc_landforms = "Flag_Landforms"
     where = task["where"]
     oid_field = taskLyr.properties.objectIdField
-
-    # read the taskLayer into a spatial dataframe
-    sdf = taskLyr.query(where=where, out_fields=[oid_field]).sdf
-
-    # check if the in memory points feature already exists, it it does, delete it
-    if arcpy.Exists("memory/points"):
-        arcpy.Delete_management("memory/points")
-
-    # conver the sdf to a feature class in memory
-    sdf.spatial.to_featureclass(location="memory/points")
-
     in_rasters = task["rules_to_run"]["flag_landforms"]["in_rasters"]
-    # loop through the in_rasters, and build the string to pass to the ExtractMultiValuesToPoints tool.
-    # The string includes the in rasters and an out field name for each raster
-    raster_string = ""
-    for i, raster in enumerate(in_rasters):
-        if i > 0:
-            raster_string += ";"
-        raster_string += "{} {} ".format(raster, "tmp_landform_{}".format(i + 1))
-
-    arcpy.sa.ExtractMultiValuesToPoints(
-        in_point_features="memory/points",
-        in_rasters=raster_string,
-        bilinear_interpolate_values="NONE",
+    # Optional folder to keep the raster tiles read for the points, reused by later runs and tasks
+    raster_tile_cache.cache_folder = (
+        task["rules_to_run"]["flag_landforms"].get("tile_cache_folder") or None
     )
-
-    # get the object id field name from the memory/points feature class
-    oid_field_fc = arcpy.ListFields("memory/points", "*", "OID")[0].name
-
-    # convert the points feature class back to a spatial dataframe
-    sdf_fc = pd.DataFrame.spatial.from_featureclass("memory/points")
-    # print(sdf_fc)
-
-    # Loop through rows in the sdf.
-    # For each row, set field_to_calc_landforms the value of any of the out fields that are not null
+    if not in_rasters:
+        logger.info("\tNo landform rasters to sample")
+        return
+
+    # Group the rasters by spatial reference, to query the points once per spatial reference
+    out_srs = {}
+    raster_sr_keys = []
+    for raster in in_rasters:
+        sr = arcpy.Describe(raster).spatialReference
+        out_sr = sr.factoryCode if sr.factoryCode else {"wkt": sr.exportToString()}
+        sr_key = json.dumps(out_sr)
+        out_srs[sr_key] = out_sr
+        raster_sr_keys.append(sr_key)
+    page_sr_key = raster_sr_keys[0]
+
+    # Read the points a page at a time in the spatial reference of the first raster. The points of
+    # the page in the other spatial references are queried by the objectId range of the page,
+    # and matched to the page by objectId
     list_to_update = []
     num_flagged = 0
-    for index, row in sdf_fc.iterrows():
-        # get the oid_field value from the row
-        oid_value = row[oid_field_fc]
-        new_attributes = {oid_field: oid_value}
-        landform = 0
-        for i, raster in enumerate(in_rasters):
-            v = row["tmp_landform_{}".format(i + 1)]
-            if pd.notna(v) and v is not None:
-                landform = v
-                break
-
-        new_attributes[field_to_calc_landforms] = landform
-        if new_attributes[field_to_calc_landforms] > 0:
-            num_flagged += 1
-
-        list_to_update.append({"attributes": new_attributes})
-
-    if arcpy.Exists("memory/points"):
-        arcpy.Delete_management("memory/points")
+    change_counts = {"unchanged": 0, "changed": 0, "null": 0}
+    for page in feature_layer_io.iter_feature_pages(
+        taskLyr,
+        where=where,
+        out_fields=[oid_field, field_to_calc_landforms],
+        return_geometry=True,
+        out_sr=out_srs[page_sr_key],
+        logger=logger,
+    ):
+        features = page.features
+        oids = np.array([f.attributes[oid_field] for f in features], dtype=np.int64)
+        current_flags = {
+            field_to_calc_landforms: feature_layer_io.column_array(
+                [f.attributes.get(field_to_calc_landforms) for f in features]
+            )
+        }
+        points_by_sr = {page_sr_key: point_arrays(features)}
+        for sr_key, out_sr in out_srs.items():
+            if sr_key in points_by_sr:
+                continue
+            sr_result = feature_layer_io.query_with_retry(
+                taskLyr,
+                logger,
+                where="({}) AND {} >= {} AND {} <= {}".format(
+                    where or "1=1", oid_field, oids[0], oid_field, oids[-1]
+                ),
+                out_fields=oid_field,
+                return_geometry=True,
+                out_sr=out_sr,
+                return_all_records=True,
+            )
+            points_by_sr[sr_key] = match_points_by_oid(
+                oids, sr_result.features, oid_field
+            )
+
+        # Sample the rasters in order. For each point, the value of the first raster that is not null wins
+        landforms = np.zeros(len(features), dtype=np.float64)
+        found = np.zeros(len(features), dtype=bool)
+        for raster, sr_key in zip(in_rasters, raster_sr_keys):
+            xs, ys = points_by_sr[sr_key]
+            values = raster_tile_cache.sample_raster(raster, xs, ys)
+            take = ~found & ~np.isnan(values)
+            landforms[take] = values[take]
+            found |= take
+
+        flags = {field_to_calc_landforms: landforms.astype(np.int64)}
+        num_flagged += int(np.count_nonzero(flags[field_to_calc_landforms] > 0))
+        changed = find_changed_flags(
+            current_flags, flags, [field_to_calc_landforms], change_counts
+        )
+        list_to_update.extend(
+            {"attributes": {oid_field: oid, field_to_calc_landforms: v}}
+            for oid, v in zip(
+                oids[changed].tolist(), flags[field_to_calc_landforms][changed].tolist()
+            )
+        )
 
     logger.info("\tNumber of flagged points: {}".format(num_flagged))
+    logger.info(
+        "\tUnchanged flags: {}, changed flags: {}, of which previously null: {}".format(
+            change_counts["unchanged"], change_counts["changed"], change_counts["null"]
+        )
+    )
 
-    if num_flagged == 0:
+    if len(list_to_update) == 0:
+        logger.info("\tAll flags are up to date")
+    elif num_flagged == 0:
         calc_field_response = taskLyr.calculate(
             where=where,
             calc_expression={"field": field_to_calc_landforms, "sqlExpression": 0},
@@ -543,23 +509,56 @@ def flag_landforms(taskItem, taskLyr, task):
         )
 
 
-def check_cornered(v, isLongitude):
+def point_arrays(features):
+    # Get the x and y arrays of point features, NaN for the features without a geometry
+    xs = np.array(
+        [f.geometry["x"] if f.geometry else np.nan for f in features],
+        dtype=np.float64,
+    )
+    ys = np.array(
+        [f.geometry["y"] if f.geometry else np.nan for f in features],
+        dtype=np.float64,
+    )
+    return xs, ys
+
+
+def match_points_by_oid(oids, features, oid_field):
+    # Get the x and y arrays of the features in the order of oids, NaN for the objectIds not in features
+    feature_oids = np.array([f.attributes[oid_field] for f in features], dtype=np.int64)
+    feature_xs, feature_ys = point_arrays(features)
+    xs = np.full(len(oids), np.nan)
+    ys = np.full(len(oids), np.nan)
+    if len(features) == 0:
+        return xs, ys
+
+    order = np.argsort(feature_oids)
+    positions = np.searchsorted(feature_oids[order], oids)
+    positions = np.minimum(positions, len(order) - 1)
+    matched = feature_oids[order][positions] == oids
+    xs[matched] = feature_xs[order][positions[matched]]
+    ys[matched] = feature_ys[order][positions[matched]]
+    return xs, ys
+
+
+# check if the points are snapped to the corners of the 3.75' quadrangle grid: 1 for points on a corner,
+# 0 for points not on a corner, and -1 where the latitude or longitude is null
+def check_cornered_array(lats, lons):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
     orig_long_in_minutes = -6693.75
     orig_lat_in_minutes = 2681.25
     cell_size = 3.75
     tolerance_min = 0.0000001
     tolerance_max = cell_size - tolerance_min
 
-    fractional_minutes = None
-    if isLongitude:
-        fractional_minutes = abs(v * 60 - orig_long_in_minutes) % cell_size
-    else:
-        fractional_minutes = abs(v * 60 - orig_lat_in_minutes) % cell_size
+    fractional_lat = np.abs(lats * 60 - orig_lat_in_minutes) % cell_size
+    fractional_lon = np.abs(lons * 60 - orig_long_in_minutes) % cell_size
+    lat_on_corner = (fractional_lat < tolerance_min) | (fractional_lat > tolerance_max)
+    lon_on_corner = (fractional_lon < tolerance_min) | (fractional_lon > tolerance_max)
 
-    if fractional_minutes < tolerance_min or fractional_minutes > tolerance_max:
-        return 1
-    else:
-        return 0
+    flags = (lat_on_corner & lon_on_corner).astype(np.int8)
+    flags[np.isnan(lats) | np.isnan(lons)] = -1
+    return flags
 
 
 def print_envs():
@@ -679,11 +678,14 @@ if __name__ == "__main__":
             add_flag_fields(taskItem, taskLyr)
             rules_to_run = task["rules_to_run"]
 
-            if not rules_to_run["flag_rounded"]["skip"]:
-                flag_rounded(taskItem, taskLyr, task)
-
-            if not rules_to_run["flag_corners"]["skip"]:
-                flag_cornered(taskItem, taskLyr, task)
+            # Run all the enabled point rules on one query of the layer
+            point_rule_names = [
+                name
+                for name in point_rules
+                if name in rules_to_run and not rules_to_run[name]["skip"]
+            ]
+            if point_rule_names:
+                flag_points(taskItem, taskLyr, task, point_rule_names)
 
             if not rules_to_run["flag_landforms"]["skip"]:
                 flag_landforms(taskItem, taskLyr, task)
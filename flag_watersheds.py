@@ -10,12 +10,29 @@ import pandas as pd
 import arcpy
 import sys
 import arcgis
+import feature_layer_io
 
 logger = None
 batch_size = 2500
 num_failed_records = 0
 num_succeeded_records = 0
 
+# Field in the in_memory feature classes holding the objectId of each feature in the layer
+fc_objectId_field = "layer_objectid"
+
+# AddFields field types of the layer field types that can be copied to the in_memory feature class
+layer_field_types = {
+    "esriFieldTypeString": "TEXT",
+    "esriFieldTypeSmallInteger": "SHORT",
+    "esriFieldTypeInteger": "LONG",
+    "esriFieldTypeBigInteger": "BIGINTEGER",
+    "esriFieldTypeSingle": "FLOAT",
+    "esriFieldTypeDouble": "DOUBLE",
+    "esriFieldTypeDate": "DATE",
+    "esriFieldTypeGUID": "GUID",
+}
+
+
 integer_field_def = {
     "type": "esriFieldTypeInteger",
     "nullable": True,
@@ -163,85 +180,28 @@ def get_logger(l_dir, t_filename, s_time):
 
 def run_update(the_func):
     def wrapper(*args, **kwargs):
-        global batch_size
         global num_failed_records
         global num_succeeded_records
 
         # Run Function & Collect Update List
         edit_list = the_func(*args)
-        num_total_records = len(edit_list)
-        num_succeeded_records = 0
-        num_failed_records = 0
 
         if edit_list:
             operation = kwargs.get("operation", None)
-            # Batch Update List Into Smaller Sets
-            # batch_size = kwargs.get("batch", None)
-            use_global_ids = kwargs.get("use_global_ids", False)
-            if not batch_size:
-                batch_size = 1000
-            update_sets = [
-                edit_list[x : x + batch_size]
-                for x in range(0, len(edit_list), batch_size)
-            ]
-            # logger.info("\nProcessing {} Batch(es)\n".format(len(update_sets)))
-
-            # Push Edit Batches
-            try:
-                for update_set in update_sets:
-                    try:
-                        keyStr = ""
-                        if operation == "update":
-                            edit_result = kwargs.get("update").edit_features(
-                                updates=update_set, use_global_ids=use_global_ids
-                            )
-                            keyStr = "updateResults"
-                        else:  # add
-                            edit_result = kwargs.get("add").edit_features(
-                                adds=update_set
-                            )
-                            keyStr = "addResults"
-
-                        totalRecords = len(edit_result[keyStr])
-
-                        succeeded_records = len(
-                            list(
-                                filter(
-                                    lambda d: d["success"] == True,
-                                    edit_result[keyStr],
-                                )
-                            )
-                        )
-                        logger.info(
-                            "\tBatch edit results: {} of {} succeeded".format(
-                                succeeded_records, totalRecords
-                            )
-                        )
-                        num_succeeded_records = (
-                            num_succeeded_records + succeeded_records
-                        )
-                        if totalRecords > succeeded_records:
-                            failed_records = list(
-                                filter(
-                                    lambda d: d["success"] == False,
-                                    edit_result[keyStr],
-                                )
-                            )
-                            num_failed_records = num_failed_records + len(
-                                failed_records
-                            )
-                            logger.info("\Failed records: {}".format(failed_records))
-
-                    except Exception:
-                        logger.info(traceback.format_exc())
-            except Exception:
-                logger.info(traceback.format_exc())
-            finally:
-                logger.info(
-                    " \n\tSummary: Total records {}, succeeded records {}, failed records {}".format(
-                        num_total_records, num_succeeded_records, num_failed_records
-                    )
-                )
+            if operation == "update":
+                edit_layer = kwargs.get("update")
+            else:  # add
+                edit_layer = kwargs.get("add")
+
+            # Push Edit Batches, several requests in flight at a time
+            num_succeeded_records, num_failed_records = feature_layer_io.push_edits(
+                edit_layer,
+                edit_list,
+                operation=operation,
+                batch_size=batch_size,
+                use_global_ids=kwargs.get("use_global_ids", False),
+                logger=logger,
+            )
 
         else:
             logger.info("Returned List Was Empty. No Edits Performed.")
@@ -296,30 +256,73 @@ def flag_size(task, taskItem, taskLyr, rule_config):
     )
 
 
-def read_featureLayer_to_featureClass(taskLyr, sWhere, outFields=[]):
+def read_featureLayer_to_featureClass(taskLyr, sWhere, outFields=None):
     logger.info("\tRead feature Layer to feature class")
     fld_objectId = taskLyr.properties.objectIdField
-    outFields.append(fld_objectId)
-    watershed_sdf = taskLyr.query(
-        where=sWhere,
-        out_fields=outFields,
-        return_geometry=True,
-        return_all_records=True,
-    ).sdf
-
-    if watershed_sdf.empty:
+    watershed_fc = "in_memory/watershed_fc"
+    # delete the feature class if it already exists
+    if arcpy.Exists(watershed_fc):
+        arcpy.management.Delete(watershed_fc)
+
+    # Create the feature class from the field definitions of the layer, so the field types and
+    # lengths do not depend on the values of the first page read
+    layer_fields = {f["name"]: f for f in taskLyr.properties.fields}
+    outFields = [fld for fld in outFields or [] if fld != fld_objectId]
+    field_descriptions = [[fc_objectId_field, "LONG", fld_objectId, ""]]
+    for fld in outFields:
+        field_type = layer_field_types[layer_fields[fld]["type"]]
+        field_length = (
+            layer_fields[fld].get("length", "") if field_type == "TEXT" else ""
+        )
+        field_descriptions.append([fld, field_type, fld, field_length])
+
+    date_field_indexes = [
+        k
+        for k, (_, field_type, _, _) in enumerate(field_descriptions[1:])
+        if field_type == "DATE"
+    ]
+
+    sr_json = taskLyr.properties.extent["spatialReference"]
+    arcpy.management.CreateFeatureclass(
+        os.path.dirname(watershed_fc),
+        os.path.basename(watershed_fc),
+        "POLYGON",
+        spatial_reference=arcpy.SpatialReference(
+            sr_json.get("latestWkid") or sr_json["wkid"]
+        ),
+    )
+    arcpy.management.AddFields(watershed_fc, field_descriptions)
+
+    # Read the layer a page at a time, several objectId ranges at a time, and insert each page
+    # into the feature class in the in_memory workspace. The pages come in objectId order
+    num_features = 0
+    with arcpy.da.InsertCursor(
+        watershed_fc, ["SHAPE@JSON", fc_objectId_field] + outFields
+    ) as ins_cursor:
+        for page in feature_layer_io.iter_feature_pages(
+            taskLyr,
+            where=sWhere,
+            out_fields=[fld_objectId] + outFields,
+            return_geometry=True,
+            logger=logger,
+        ):
+            for f in page.features:
+                values = [f.attributes.get(fld) for fld in outFields]
+                for k in date_field_indexes:
+                    if values[k] is not None:  # epoch milliseconds
+                        values[k] = datetime.utcfromtimestamp(values[k] / 1000)
+                shape_json = None
+                if f.geometry:
+                    shape_json = json.dumps({**f.geometry, "spatialReference": sr_json})
+                ins_cursor.insertRow([shape_json, f.attributes[fld_objectId]] + values)
+            num_features += len(page.features)
+
+    if num_features == 0:
         logger.info("\tNo features found in the layer")
+        arcpy.management.Delete(watershed_fc)
         return None, None
     else:
-        logger.info("\tNumber of features found: {}".format(len(watershed_sdf)))
-
-        # Save the spatial dataframe to a feature class in the in_memory workspace
-        watershed_fc = "in_memory/watershed_fc"
-        # delete the feature class if it already exists
-        if arcpy.Exists(watershed_fc):
-            arcpy.management.Delete(watershed_fc)
-
-        watershed_sdf.spatial.to_featureclass(location=watershed_fc)
+        logger.info("\tNumber of features found: {}".format(num_features))
         return fld_objectId, watershed_fc
 
 
@@ -357,10 +360,10 @@ def calc_flag_values(
         field_type="SHORT",
     )
 
-    # Read the features with flag value <> 0 to a dataframe, only keep the objectid and the flag field,
+    # Read the features with flag value <> 0 to a dataframe, only keep the layer objectid and the flag field,
     out_sdf = pd.DataFrame.spatial.from_featureclass(
         fc,
-        fields=[fld_objectId, field_to_calc],
+        fields=[fc_objectId_field, field_to_calc],
         where_clause="{} <> 0".format(field_to_calc),
     )
 
@@ -373,7 +376,7 @@ def calc_flag_values(
     list_to_update = []
     # for each feature in the feature set, create a dictionary with the object and the flag value
     for f in fs.features:
-        new_attributes = {fld_objectId: f.attributes[fld_objectId]}
+        new_attributes = {fld_objectId: f.attributes[fc_objectId_field]}
         new_attributes[field_to_calc] = f.attributes[field_to_calc]
         list_to_update.append({"attributes": new_attributes})
 
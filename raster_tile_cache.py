@@ -0,0 +1,202 @@
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+
+import arcpy
+import numpy as np
+
+# Point lookups on large rasters, reading only the tiles that hold points.
+# Decoded tiles are kept in an in-memory LRU cache under a memory budget, and
+# optionally saved as .npy files so later runs can memory-map them instead of
+# reading the raster again.
+
+# Number of cells on each side of a tile
+tile_size = 512
+# Memory budget of the tile cache, in bytes, memory-mapped tiles included
+cache_max_bytes = 512 * 1024 * 1024
+# Folder of the on-disk tile cache, None to keep tiles in memory only
+cache_folder = None
+
+# (raster key, tile row, tile column): tile array, least recently used first
+tile_cache = OrderedDict()
+tile_cache_bytes = 0
+# raster path: dict of the raster properties needed for the lookups
+raster_info = {}
+
+
+def raster_modified_stamp(raster_path):
+    # Modification stamp of the raster: the modification time and size of the raster file, or,
+    # for a raster stored in a folder such as a file geodatabase or a grid, the newest modification
+    # time, the total size and the number of the files in that folder. The folder's own
+    # modification time does not change when a raster is rewritten in place
+    path = raster_path
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if not parent or parent == path:
+            return None
+        path = parent
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return "{}|{}".format(stat.st_mtime_ns, stat.st_size)
+
+    stats = [entry.stat() for entry in os.scandir(path) if entry.is_file()]
+    return "{}|{}|{}".format(
+        max((stat.st_mtime_ns for stat in stats), default=0),
+        sum(stat.st_size for stat in stats),
+        len(stats),
+    )
+
+
+def get_raster_info(raster_path):
+    # Read the raster properties once per raster
+    if raster_path not in raster_info:
+        raster = arcpy.Raster(raster_path)
+        info = {
+            "raster": raster,
+            "x_min": raster.extent.XMin,
+            "y_max": raster.extent.YMax,
+            "cell_width": raster.meanCellWidth,
+            "cell_height": raster.meanCellHeight,
+            "width": raster.width,
+            "height": raster.height,
+            "no_data": raster.noDataValue,
+        }
+        # Key of the raster's tiles, changes if the raster's grid changes or the raster is rewritten
+        grid = "{}|{}|{}|{}|{}|{}|{}|{}|{}".format(
+            raster_path,
+            info["x_min"],
+            info["y_max"],
+            info["cell_width"],
+            info["cell_height"],
+            info["width"],
+            info["height"],
+            tile_size,
+            raster_modified_stamp(raster_path),
+        )
+        info["key"] = hashlib.md5(grid.encode("utf-8")).hexdigest()
+        raster_info[raster_path] = info
+    return raster_info[raster_path]
+
+
+def read_tile(info, tile_row, tile_col):
+    # Read one tile of cells from the raster
+    row_min = tile_row * tile_size
+    col_min = tile_col * tile_size
+    nrows = min(tile_size, info["height"] - row_min)
+    ncols = min(tile_size, info["width"] - col_min)
+    lower_left = arcpy.Point(
+        float(info["x_min"] + col_min * info["cell_width"]),
+        float(info["y_max"] - (row_min + nrows) * info["cell_height"]),
+    )
+    return arcpy.RasterToNumPyArray(
+        info["raster"],
+        lower_left_corner=lower_left,
+        ncols=int(ncols),
+        nrows=int(nrows),
+    )
+
+
+def get_tile(info, tile_row, tile_col):
+    """
+    Get a tile from the in-memory cache, the on-disk cache, or the raster, in that order.
+    """
+    global tile_cache_bytes
+
+    key = (info["key"], tile_row, tile_col)
+    if key in tile_cache:
+        tile_cache.move_to_end(key)
+        return tile_cache[key]
+
+    tile = None
+    tile_file = None
+    if cache_folder:
+        tile_file = os.path.join(
+            cache_folder, "{}_{}_{}.npy".format(info["key"], tile_row, tile_col)
+        )
+        if os.path.exists(tile_file):
+            try:
+                tile = np.load(tile_file, mmap_mode="r")
+            except (OSError, ValueError):
+                tile = None  # a damaged tile file, read the tile again and replace it
+
+    if tile is None:
+        tile = read_tile(info, tile_row, tile_col)
+        if tile_file:
+            save_tile(tile_file, tile)
+
+    # Memory-mapped tiles count against the budget too, so the open mappings stay bounded
+    tile_cache[key] = tile
+    tile_cache_bytes += tile.nbytes
+
+    # Evict the least recently used tiles until the cache is within its budget
+    while tile_cache_bytes > cache_max_bytes and len(tile_cache) > 1:
+        _, evicted = tile_cache.popitem(last=False)
+        tile_cache_bytes -= evicted.nbytes
+
+    return tile
+
+
+def save_tile(tile_file, tile):
+    # Write the tile to a temporary file and move it into place, so an interrupted or
+    # concurrent run never leaves a partly written tile file for later runs to map
+    os.makedirs(cache_folder, exist_ok=True)
+    fd, temp_file = tempfile.mkstemp(dir=cache_folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, tile)
+        os.replace(temp_file, tile_file)
+    except OSError:
+        # The tile stays in memory only, e.g. when another run has the tile file mapped on Windows
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def clear_cache():
+    global tile_cache_bytes
+    tile_cache.clear()
+    raster_info.clear()
+    tile_cache_bytes = 0
+
+
+def sample_raster(raster_path, xs, ys):
+    """
+    Read the raster values under the points, given in the spatial reference of the raster.
+    Only the tiles that hold points are read.
+
+    Returns:
+    array: float64 values, NaN for points off the raster or on NoData cells
+    """
+    info = get_raster_info(raster_path)
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    values = np.full(len(xs), np.nan, dtype=np.float64)
+
+    cols = np.floor((xs - info["x_min"]) / info["cell_width"])
+    rows = np.floor((info["y_max"] - ys) / info["cell_height"])
+    inside = (
+        (cols >= 0) & (cols < info["width"]) & (rows >= 0) & (rows < info["height"])
+    )
+    if not inside.any():
+        return values
+
+    idx = np.nonzero(inside)[0]
+    rows = rows[inside].astype(np.int64)
+    cols = cols[inside].astype(np.int64)
+
+    # Sort the points by tile and look them up one tile at a time
+    num_tile_cols = (info["width"] + tile_size - 1) // tile_size
+    tile_ids = (rows // tile_size) * num_tile_cols + cols // tile_size
+    order = np.argsort(tile_ids, kind="stable")
+    sorted_tile_ids = tile_ids[order]
+    tile_starts = np.flatnonzero(np.diff(sorted_tile_ids)) + 1
+    for in_tile in np.split(order, tile_starts):
+        tile_row, tile_col = divmod(int(tile_ids[in_tile[0]]), num_tile_cols)
+        tile = get_tile(info, tile_row, tile_col)
+        values[idx[in_tile]] = tile[
+            rows[in_tile] - tile_row * tile_size, cols[in_tile] - tile_col * tile_size
+        ]
+
+    if info["no_data"] is not None:
+        values[values == info["no_data"]] = np.nan
+    return values
@@ -0,0 +1,68 @@
+import os
+import sys
+import types
+
+# The scripts import arcpy and the ArcGIS API for Python at the top. Neither is needed by
+# the functions under test, so stand-in modules are registered when they are not installed.
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if repo_dir not in sys.path:
+    sys.path.insert(0, repo_dir)
+
+
+def stub_module(name, **attributes):
+    module = types.ModuleType(name)
+    for attribute, value in attributes.items():
+        setattr(module, attribute, value)
+    sys.modules[name] = module
+    return module
+
+
+def no_op(*args, **kwargs):
+    return None
+
+
+try:
+    import arcpy  # noqa: F401
+except ImportError:
+    arcpy_da = stub_module("arcpy.da")
+    arcpy_sa = stub_module("arcpy.sa")
+    stub_module(
+        "arcpy",
+        da=arcpy_da,
+        sa=arcpy_sa,
+        AddMessage=no_op,
+        AddWarning=no_op,
+        AddError=no_op,
+    )
+
+try:
+    import arcgis  # noqa: F401
+except ImportError:
+    arcgis_analysis = stub_module("arcgis.features.analysis", create_watersheds=no_op)
+    arcgis_features = stub_module(
+        "arcgis.features",
+        GeoAccessor=object,
+        FeatureLayerCollection=object,
+        FeatureSet=object,
+        analysis=arcgis_analysis,
+    )
+    arcgis_gis = stub_module("arcgis.gis", GIS=object)
+    arcgis_geometry = stub_module(
+        "arcgis.geometry",
+        Point=object,
+        Polygon=object,
+        Geometry=object,
+        project=no_op,
+        areas_and_lengths=no_op,
+        buffer=no_op,
+        LengthUnits=object,
+        AreaUnits=object,
+    )
+    stub_module(
+        "arcgis",
+        __version__="stub",
+        features=arcgis_features,
+        gis=arcgis_gis,
+        geometry=arcgis_geometry,
+    )
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import create_borehole_lines_tool as tool
+
+scalar_methods = {
+    "Minimum Curvature": tool.minimum_curvature,
+    "Average Angle": tool.average_angle,
+    "Radius of Curvature": tool.radius_curvature,
+}
+
+
+def desurvey_holes_scalar(md, dip, azm, hole_offsets, method):
+    # The station by station loop the tool used before desurvey_holes
+    tvd = np.zeros(len(md))
+    ew = np.zeros(len(md))
+    ns = np.zeros(len(md))
+    for start, end in zip(hole_offsets[:-1], hole_offsets[1:]):
+        previous_value = [md[start], 0, 0, 0]
+        for i in range(start + 1, end):
+            new_value = scalar_methods[method](
+                md[i - 1], 90 - dip[i - 1], azm[i - 1], md[i], 90 - dip[i], azm[i]
+            )
+            previous_value = [
+                new_value[0],
+                previous_value[1] + new_value[1],
+                previous_value[2] + new_value[2],
+                previous_value[3] + new_value[3],
+            ]
+            tvd[i], ew[i], ns[i] = previous_value[1:]
+    return tvd, ew, ns
+
+
+def survey_holes(seed):
+    # Holes of different station counts, with straight runs, bends and single-station holes
+    rng = np.random.default_rng(seed)
+    md, dip, azm, hole_offsets = [], [], [], [0]
+    for num_stations in [1, 2, 5, 12, 3, 30]:
+        lengths = np.cumsum(rng.uniform(1, 50, num_stations)) - 1
+        dips = rng.uniform(-89, -30, num_stations)
+        azimuths = rng.uniform(0, 359, num_stations)
+        if num_stations > 3:
+            dips[1:3] = dips[0]
+            azimuths[2:4] = azimuths[1]
+        md.extend(lengths)
+        dip.extend(dips)
+        azm.extend(azimuths)
+        hole_offsets.append(hole_offsets[-1] + num_stations)
+    return np.array(md), np.array(dip), np.array(azm), np.array(hole_offsets)
+
+
+@pytest.mark.parametrize("method", list(scalar_methods))
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_desurvey_holes_matches_scalar_loop(method, seed):
+    md, dip, azm, hole_offsets = survey_holes(seed)
+
+    expected = desurvey_holes_scalar(md, dip, azm, hole_offsets, method)
+    result = tool.desurvey_holes(md, dip, azm, hole_offsets, method)
+
+    for values, expected_values in zip(result, expected):
+        np.testing.assert_allclose(values, expected_values, rtol=1e-9, atol=1e-9)
+
+
+def test_desurvey_holes_vertical_hole():
+    md = np.array([0.0, 10.0, 25.0])
+    dip = np.array([90.0, 90.0, 90.0])
+    azm = np.array([0.0, 0.0, 0.0])
+
+    tvd, ew, ns = tool.desurvey_holes(md, dip, azm, [0, 3], "Minimum Curvature")
+
+    np.testing.assert_allclose(tvd, [0.0, 10.0, 25.0])
+    np.testing.assert_allclose(ew, 0.0, atol=1e-12)
+    np.testing.assert_allclose(ns, 0.0, atol=1e-12)
+
+
+def test_desurvey_holes_keeps_a_bad_station_within_its_hole():
+    md, dip, azm, hole_offsets = survey_holes(3)
+    # A missing dip halfway down the fourth hole
+    dip[hole_offsets[3] + 5] = np.nan
+
+    expected = desurvey_holes_scalar(md, dip, azm, hole_offsets, "Average Angle")
+    result = tool.desurvey_holes(md, dip, azm, hole_offsets, "Average Angle")
+
+    for values, expected_values in zip(result, expected):
+        np.testing.assert_allclose(values, expected_values, rtol=1e-9, atol=1e-9)
+    assert np.isnan(result[0][hole_offsets[3] + 5 : hole_offsets[4]]).all()
+    assert np.isfinite(result[0][hole_offsets[4] :]).all()
@@ -0,0 +1,200 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import create_lab_segments_tool as tool
+
+
+def interpolate_xyz_at_m_scalar(segments, m_len, hole_id):
+    # The segment by segment search the tool used before interpolate_xyz_at_m took arrays
+    end_len = None
+    for i in range(len(segments) - 1):
+        start_len = segments[i][3]
+        end_len = segments[i + 1][3]
+        if start_len <= m_len <= end_len:
+            ratio = (m_len - start_len) / (end_len - start_len)
+            x = segments[i][0] + ratio * (segments[i + 1][0] - segments[i][0])
+            y = segments[i][1] + ratio * (segments[i + 1][1] - segments[i][1])
+            z = segments[i][2] + ratio * (segments[i + 1][2] - segments[i][2])
+            return x, y, z
+
+    padding = 0.0001
+    if end_len is not None and end_len <= m_len <= end_len + padding:
+        return segments[-1][0], segments[-1][1], segments[-1][2]
+    return None, None, None
+
+
+def calculate_lab_segments_scalar(borehole_dict, lab_df):
+    # The row by row loop the tool used before calculate_lab_segments grouped the rows by hole
+    for index, row in lab_df.iterrows():
+        hole_id = row[tool.hole_id_field]
+        if hole_id not in borehole_dict:
+            continue
+        segments = borehole_dict[hole_id]["segments"]
+        from_xyz = interpolate_xyz_at_m_scalar(
+            segments, row[tool.from_len_field], hole_id
+        )
+        to_xyz = interpolate_xyz_at_m_scalar(segments, row[tool.to_len_field], hole_id)
+        for field, value in zip(tool.xyz_fields, from_xyz + to_xyz):
+            lab_df.at[index, field] = value
+
+
+def as_float(value):
+    return np.nan if value is None else value
+
+
+@pytest.fixture
+def segments():
+    return np.array(
+        [
+            [0.0, 0.0, 100.0, 0.0],
+            [1.0, 2.0, 90.0, 10.0],
+            [1.0, 2.0, 90.0, 10.0],
+            [3.0, 5.0, 70.0, 25.0],
+            [4.0, 9.0, 50.0, 40.5],
+        ]
+    )
+
+
+def test_interpolate_xyz_at_m_matches_scalar(segments):
+    m_lens = [0.0, 4.2, 10.0, 17.3, 25.0, 40.5, 40.50005, 40.6, -1.0, 33.0]
+
+    result = tool.interpolate_xyz_at_m(segments, m_lens, "DH-1")
+
+    for m_len, xyz in zip(m_lens, result):
+        expected = interpolate_xyz_at_m_scalar(segments, m_len, "DH-1")
+        np.testing.assert_allclose(xyz, [as_float(v) for v in expected], rtol=1e-12)
+
+
+def test_interpolate_xyz_at_m_warns_for_lengths_off_the_hole(segments, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(tool.arcpy, "AddWarning", warnings.append, raising=False)
+
+    tool.interpolate_xyz_at_m(segments, [5.0, 41.0, -2.0], "DH-1")
+
+    assert warnings == [
+        "Length 41.0 not found in any segments of DH-1.",
+        "Length -2.0 not found in any segments of DH-1.",
+    ]
+
+
+def test_calculate_lab_segments_matches_row_loop(segments):
+    borehole_dict = {
+        "DH-1": {"segments": segments},
+        "DH-2": {"segments": segments[::2] + [10.0, 0.0, 0.0, 0.0]},
+    }
+    lab_df = pd.DataFrame(
+        {
+            tool.hole_id_field: [
+                "DH-2",
+                "DH-1",
+                None,
+                "DH-9",
+                "DH-1",
+                "DH-2",
+                "DH-1",
+            ],
+            tool.from_len_field: [0.0, 4.0, 1.0, 2.0, 10.0, 30.0, 40.0],
+            tool.to_len_field: [5.0, 10.0, 2.0, 3.0, 25.0, 40.5, 40.50005],
+        }
+    )
+    expected_df = lab_df.copy()
+    for field in tool.xyz_fields:
+        expected_df[field] = np.nan
+
+    calculate_lab_segments_scalar(borehole_dict, expected_df)
+    tool.calculate_lab_segments(borehole_dict, lab_df)
+
+    np.testing.assert_allclose(
+        lab_df[tool.xyz_fields].to_numpy(dtype=np.float64),
+        expected_df[tool.xyz_fields].to_numpy(dtype=np.float64),
+        rtol=1e-12,
+    )
+    # Rows without a hole id or with an unknown hole keep no coordinates
+    assert lab_df.loc[[2, 3], tool.xyz_fields].isna().all().all()
+
+
+class FakeInsertCursor:
+    def __init__(self, table, fields):
+        self.fields = fields
+        self.rows = []
+
+    def insertRow(self, row):
+        self.rows.append(row)
+
+
+@pytest.fixture
+def lab_csv(tmp_path, monkeypatch, segments):
+    # A lab csv with the holes out of order and an integer column with nulls,
+    # listed by the fake arcpy.ListFields as ArcGIS lists its fields
+    lab_csv = tmp_path / "lab.csv"
+    lab_csv.write_text(
+        "holeID,from_m,to_m,sample,Cu\n"
+        "DH-2,0,5,7,0.5\n"
+        "DH-1,4,10,,0.25\n"
+        "DH-2,30,40.5,9,\n"
+        "DH-1,10,25,11,1.5\n"
+    )
+    list_fields = [
+        SimpleNamespace(name="ObjectID", type="OID", length=4),
+        SimpleNamespace(name="holeID", type="String", length=8000),
+        SimpleNamespace(name="from_m", type="Double", length=8),
+        SimpleNamespace(name="to_m", type="Double", length=8),
+        SimpleNamespace(name="sample", type="Integer", length=4),
+        SimpleNamespace(name="Cu", type="Double", length=8),
+    ]
+    cursors = []
+
+    def insert_cursor(table, fields):
+        cursors.append(FakeInsertCursor(table, fields))
+        return cursors[-1]
+
+    arcpy = tool.arcpy
+    monkeypatch.setattr(arcpy, "ListFields", lambda table: list_fields, raising=False)
+    monkeypatch.setattr(
+        arcpy, "management", SimpleNamespace(AddFields=lambda *a: None), raising=False
+    )
+    monkeypatch.setattr(arcpy.da, "InsertCursor", insert_cursor, raising=False)
+    monkeypatch.setattr(arcpy, "SetParameterAsText", lambda *a: None, raising=False)
+    borehole_dict = {
+        "DH-1": {"segments": segments},
+        "DH-2": {"segments": segments[::2] + [10.0, 0.0, 0.0, 0.0]},
+    }
+    return SimpleNamespace(
+        path=str(lab_csv),
+        list_fields=list_fields,
+        cursors=cursors,
+        borehole_dict=borehole_dict,
+    )
+
+
+def test_stream_lab_segments_writes_nulls_as_none(lab_csv):
+    tool.stream_lab_segments_to_fc(lab_csv.borehole_dict, lab_csv.path, "fc", 2)
+
+    cursor = lab_csv.cursors[0]
+    rows = [dict(zip(cursor.fields, row)) for row in cursor.rows]
+    assert sorted((row["holeID"], row["from_m"]) for row in rows) == [
+        ("DH-1", 4.0),
+        ("DH-1", 10.0),
+        ("DH-2", 0.0),
+        ("DH-2", 30.0),
+    ]
+    for row in rows:
+        assert not any(isinstance(v, float) and math.isnan(v) for v in row.values())
+        assert row["SHAPE@JSON"] is not None
+    by_from_m = {row["from_m"]: row for row in rows}
+    assert by_from_m[4.0]["sample"] is None
+    assert by_from_m[10.0]["sample"] == 11
+    assert by_from_m[30.0]["Cu"] is None
+
+
+def test_stream_lab_segments_rejects_renamed_columns(lab_csv):
+    # ArcGIS lists the "Cu" column of the csv under another name
+    lab_csv.list_fields[-1] = SimpleNamespace(name="Cu_ppm", type="Double", length=8)
+
+    with pytest.raises(ValueError, match="Cu_ppm"):
+        tool.stream_lab_segments_to_fc(lab_csv.borehole_dict, lab_csv.path, "fc", 2)
+    assert lab_csv.cursors == []
@@ -0,0 +1,151 @@
+import math
+
+import numpy as np
+import pytest
+
+import drill_hole_xyz
+
+
+def drill_hole_end_point_scalar(lat, lon, elev, lngth, sections, new_latlon):
+    # The section by section walk to one length that the scripts used before desurvey_at_lengths
+    current_lat = lat
+    current_lon = lon
+    current_elev = elev
+    for i in range(len(sections) - 1):
+        section_start, dip, azimuth = sections[i]
+        section_end = sections[i + 1][0]
+        if section_start >= lngth:
+            break
+        section_lngth = min(section_end, lngth) - section_start
+        if section_lngth <= 0:
+            continue
+        current_lat, current_lon = new_latlon(
+            lat, current_lat, current_lon, azimuth, section_lngth, dip
+        )
+        current_elev -= section_lngth * math.sin(math.radians(abs(dip)))
+    return {"x": current_lon, "y": current_lat, "z": current_elev}
+
+
+def round_earth_latlon(entry_lat, lat, lon, azimuth, length_m, dip):
+    # Step of the former compute_new_latlon_roundEarth and drill_hole_end_point
+    rad = math.pi / 180
+    earth_radius = 6371000
+    horizontal_lngth = length_m * math.cos(abs(dip) * rad)
+    delta_lat = (horizontal_lngth * math.cos(azimuth * rad)) / earth_radius
+    delta_lon = (horizontal_lngth * math.sin(azimuth * rad)) / (
+        earth_radius * math.cos(entry_lat * rad)
+    )
+    return lat + delta_lat / rad, lon + delta_lon / rad
+
+
+def geodesic_latlon(entry_lat, lat, lon, azimuth, length_m, dip):
+    # Step of the former compute_new_latlon, with geopy's geodesic
+    from geopy.distance import geodesic
+
+    distance_m = length_m * math.cos(math.radians(abs(dip)))
+    new_point = geodesic(kilometers=distance_m / 1000).destination((lat, lon), azimuth)
+    return new_point.latitude, new_point.longitude
+
+
+# [[start_lngth, dip, azimuth], ...] with a repeated station and a last station past the lengths
+sections = [
+    [0, -60, 45],
+    [35.5, -62, 50],
+    [35.5, -62, 50],
+    [120, -70, 310],
+    [400, -15, 185],
+    [900, -85, 0],
+]
+lngths = [0, 12.25, 35.5, 35.5, 80, 120, 399.9, 650, 900, 1000, 5]
+
+
+def assert_same_positions(positions, expected_positions, degrees=1e-10, meters=1e-6):
+    for position, expected in zip(positions, expected_positions):
+        assert position["x"] == pytest.approx(expected["x"], abs=degrees)
+        assert position["y"] == pytest.approx(expected["y"], abs=degrees)
+        assert position["z"] == pytest.approx(expected["z"], abs=meters)
+
+
+def test_spherical_model_matches_round_earth_steps():
+    lat, lon, elev = 64.12, -147.5, 420.0
+
+    positions = drill_hole_xyz.desurvey_at_lengths(
+        lat, lon, elev, lngths, sections, model="spherical"
+    )
+
+    expected_positions = [
+        drill_hole_end_point_scalar(lat, lon, elev, lngth, sections, round_earth_latlon)
+        for lngth in lngths
+    ]
+    assert_same_positions(positions, expected_positions)
+
+
+def test_ellipsoidal_model_matches_geodesic_steps():
+    pytest.importorskip("geopy")
+    lat, lon, elev = -33.9, 18.4, 1250.0
+
+    positions = drill_hole_xyz.desurvey_at_lengths(
+        lat, lon, elev, lngths, sections, model="ellipsoidal"
+    )
+
+    expected_positions = [
+        drill_hole_end_point_scalar(lat, lon, elev, lngth, sections, geodesic_latlon)
+        for lngth in lngths
+    ]
+    # 1e-9 degrees is about 0.1 mm
+    assert_same_positions(positions, expected_positions, degrees=1e-9)
+
+
+def test_vincenty_direct_matches_geodesic():
+    pytest.importorskip("geopy")
+    rng = np.random.default_rng(7)
+    lats = rng.uniform(-80, 80, 50)
+    lons = rng.uniform(-180, 180, 50)
+    azimuths = rng.uniform(0, 360, 50)
+    distances_m = rng.uniform(0, 5000, 50)
+
+    new_lats, new_lons = drill_hole_xyz.vincenty_direct(
+        lats, lons, azimuths, distances_m
+    )
+
+    for k in range(50):
+        expected_lat, expected_lon = geodesic_latlon(
+            None, lats[k], lons[k], azimuths[k], distances_m[k], 0
+        )
+        assert new_lats[k] == pytest.approx(expected_lat, abs=1e-9)
+        assert new_lons[k] == pytest.approx(expected_lon, abs=1e-9)
+
+
+@pytest.mark.parametrize("model", ["enu", "collar_enu"])
+def test_local_frame_models_stay_close_to_the_ellipsoidal_model(model):
+    comparison = drill_hole_xyz.compare_earth_models(
+        40.5, -111.9, 1500.0, lngths, sections, models=[model]
+    )
+
+    # Within the audit tolerance of calc_xyz_boreholes on a 1 km hole
+    assert comparison[model]["max_deviation_m"] < 0.25
+
+
+def test_hole_without_sections_stays_at_the_collar():
+    for model in ["ellipsoidal", "collar_enu"]:
+        positions = drill_hole_xyz.desurvey_at_lengths(
+            10.0, 20.0, 30.0, [0, 50], [[0, -90, 0]], model=model
+        )
+        assert positions == [{"x": 20.0, "y": 10.0, "z": 30.0}] * 2
+
+
+@pytest.mark.parametrize("elev", [0.0, 1500.0])
+def test_collar_enu_deviation_on_a_horizontal_hole(elev):
+    # A straight horizontal 1.2 km hole, where the collar frame deviates the most
+    reach_m = 1200.0
+    radius_m = drill_hole_xyz.earth_radius
+    horizontal_sections = [[0, 0, 75], [reach_m, 0, 75]]
+
+    comparison = drill_hole_xyz.compare_earth_models(
+        40.5, -111.9, elev, [reach_m], horizontal_sections, models=["collar_enu"]
+    )
+
+    expected_m = math.hypot(reach_m**2 / (2 * radius_m), reach_m * elev / radius_m)
+    assert comparison["collar_enu"]["max_deviation_m"] == pytest.approx(
+        expected_m, rel=0.05
+    )
@@ -0,0 +1,245 @@
+import re
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import feature_layer_io
+
+
+class Properties(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+class FakeLayer:
+    # Feature layer serving objectIds from memory, with the query parameters the module uses
+    def __init__(self, oids, max_record_count=1000, statistics=True, page_cap=None):
+        self.oids = np.array(sorted(oids), dtype=np.int64)
+        self.properties = Properties(
+            objectIdField="OBJECTID", maxRecordCount=max_record_count
+        )
+        self.statistics = statistics
+        # Server-side cap on the rows returned per query, below the advertised maxRecordCount
+        self.page_cap = page_cap
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def query(
+        self, where="1=1", out_statistics=None, result_record_count=None, **kwargs
+    ):
+        with self.lock:
+            self.queries.append(where)
+        oids = self.oids
+        for operator, value in re.findall(r"OBJECTID (>|<=) (-?\d+)", where):
+            value = int(value)
+            oids = oids[oids > value] if operator == ">" else oids[oids <= value]
+
+        if out_statistics is not None:
+            if not self.statistics:
+                raise Exception("Statistics are not supported")
+            # Some services return the statistic field names in upper case
+            attributes = {
+                "COUNT_OID": len(oids),
+                "MIN_OID": int(oids.min()) if len(oids) else None,
+                "MAX_OID": int(oids.max()) if len(oids) else None,
+            }
+            return SimpleNamespace(features=[SimpleNamespace(attributes=attributes)])
+
+        if result_record_count:
+            oids = oids[:result_record_count]
+        if self.page_cap:
+            oids = oids[: self.page_cap]
+        return SimpleNamespace(
+            features=[
+                SimpleNamespace(attributes={"OBJECTID": int(oid)}) for oid in oids
+            ]
+        )
+
+
+def sparse_oids():
+    # A dense block, a few scattered features, and a dense block far from the rest
+    return (
+        list(range(1, 501))
+        + [1000, 25000, 25001, 90000]
+        + list(range(500000, 503000))
+        + [10**7]
+    )
+
+
+def page_oids(pages):
+    return [f.attributes["OBJECTID"] for page in pages for f in page.features]
+
+
+def test_split_oid_ranges_on_sparse_oids():
+    oids = sparse_oids()
+    layer = FakeLayer(oids)
+
+    ranges = feature_layer_io.split_oid_ranges(layer, "1=1", "OBJECTID", 500)
+
+    assert len(ranges) == int(np.ceil(len(oids) / 500))
+    assert ranges[0][0] == 1
+    assert ranges[-1][1] == 10**7
+    for (first_oid, last_oid), (next_first_oid, _) in zip(ranges, ranges[1:]):
+        assert first_oid <= last_oid
+        assert next_first_oid == last_oid + 1
+
+
+def test_split_oid_ranges_resumes_after_start_oid():
+    layer = FakeLayer(sparse_oids())
+
+    ranges = feature_layer_io.split_oid_ranges(
+        layer, "1=1", "OBJECTID", 500, start_oid=90000
+    )
+
+    assert ranges[0][0] == 90001
+    assert ranges[-1][1] == 10**7
+    assert (
+        feature_layer_io.split_oid_ranges(
+            layer, "1=1", "OBJECTID", 500, start_oid=10**7
+        )
+        == []
+    )
+
+
+def test_split_oid_ranges_without_statistics_or_features():
+    assert (
+        feature_layer_io.split_oid_ranges(
+            FakeLayer([1, 2, 3], statistics=False), "1=1", "OBJECTID", 500
+        )
+        is None
+    )
+    assert (
+        feature_layer_io.split_oid_ranges(FakeLayer([]), "1=1", "OBJECTID", 500) == []
+    )
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_iter_feature_pages_reads_sparse_oids_in_order(max_workers):
+    oids = sparse_oids()
+    layer = FakeLayer(oids, max_record_count=200)
+    progress = {}
+
+    pages = list(
+        feature_layer_io.iter_feature_pages(
+            layer, page_size=500, progress=progress, max_workers=max_workers
+        )
+    )
+
+    assert page_oids(pages) == oids
+    assert all(0 < len(page.features) <= 200 for page in pages)
+    assert progress["last_oid"] == 10**7
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_iter_oid_range_pages_reads_pages_capped_below_page_size(max_workers):
+    oids = sparse_oids()
+    layer = FakeLayer(oids, max_record_count=None, page_cap=150)
+    oid_ranges = feature_layer_io.split_oid_ranges(layer, "1=1", "OBJECTID", 500)
+
+    pages = list(
+        feature_layer_io.iter_oid_range_pages(
+            layer, "1=1", ["*"], False, 500, oid_ranges, max_workers
+        )
+    )
+
+    assert page_oids(pages) == oids
+    assert all(0 < len(page.features) <= 150 for page in pages)
+
+
+def test_iter_oid_range_pages_clamps_page_size_to_max_record_count():
+    oids = sparse_oids()
+    layer = FakeLayer(oids, max_record_count=200)
+    oid_ranges = feature_layer_io.split_oid_ranges(layer, "1=1", "OBJECTID", 500)
+
+    pages = list(
+        feature_layer_io.iter_oid_range_pages(
+            layer, "1=1", ["*"], False, 500, oid_ranges, 4
+        )
+    )
+
+    assert page_oids(pages) == oids
+    assert all(0 < len(page.features) <= 200 for page in pages)
+
+
+def test_iter_feature_pages_resumes_from_progress():
+    oids = sparse_oids()
+    layer = FakeLayer(oids, max_record_count=200)
+    progress = {}
+
+    pages = feature_layer_io.iter_feature_pages(layer, progress=progress)
+    read_oids = page_oids([next(pages) for _ in range(3)])
+    pages.close()
+    resumed = feature_layer_io.iter_feature_pages(layer, start_oid=progress["last_oid"])
+
+    # Every objectId is read, the ones up to progress["last_oid"] possibly twice
+    assert progress["last_oid"] <= read_oids[-1]
+    combined = [oid for oid in read_oids if oid <= progress["last_oid"]]
+    assert combined + page_oids(resumed) == oids
+
+
+@pytest.fixture
+def batch_limits(monkeypatch):
+    monkeypatch.setattr(feature_layer_io, "min_batch_size", 50)
+    monkeypatch.setattr(feature_layer_io, "max_batch_size", 5000)
+    monkeypatch.setattr(feature_layer_io, "target_batch_seconds", 10)
+    monkeypatch.setattr(feature_layer_io, "max_batch_bytes", 1024 * 1024)
+
+
+def test_adapt_batch_size_changes_by_at_most_a_factor_of_2(batch_limits):
+    batch_state = feature_layer_io.new_batch_state(1000)
+
+    # Fast requests: grows, but only doubles each time
+    feature_layer_io.adapt_batch_size(batch_state, 1000, 0.1, 1000)
+    assert batch_state["size"] == 2000
+    # Slow requests: shrinks, but only halves each time
+    feature_layer_io.adapt_batch_size(batch_state, 2000, 1000, 2000)
+    assert batch_state["size"] == 1000
+
+
+def test_adapt_batch_size_converges_to_the_target_time(batch_limits):
+    batch_state = feature_layer_io.new_batch_state(100)
+
+    # The service writes 120 records a second, so 10 second requests hold 1200 records
+    for _ in range(10):
+        size = batch_state["size"]
+        feature_layer_io.adapt_batch_size(batch_state, size, size / 120, size * 100)
+
+    assert batch_state["size"] == 1200
+
+
+def test_adapt_batch_size_keeps_requests_under_the_byte_limit(batch_limits):
+    batch_state = feature_layer_io.new_batch_state(1000)
+
+    # 1 KiB records, so at most 1024 records fit in max_batch_bytes
+    for _ in range(5):
+        size = batch_state["size"]
+        feature_layer_io.adapt_batch_size(batch_state, size, 0.01, size * 1024)
+
+    assert batch_state["size"] == 1024
+
+
+def test_adapt_batch_size_stays_within_bounds(batch_limits):
+    batch_state = feature_layer_io.new_batch_state(10**6)
+    assert batch_state["size"] == 5000
+    for _ in range(5):
+        feature_layer_io.adapt_batch_size(batch_state, 5000, 0.001, 5000)
+    assert batch_state["size"] == 5000
+
+    for _ in range(10):
+        feature_layer_io.adapt_batch_size(batch_state, 50, 3600, 50)
+    assert batch_state["size"] == 50
+
+    # No records gives nothing to adapt to
+    feature_layer_io.adapt_batch_size(batch_state, 0, 3600, 0)
+    assert batch_state["size"] == 50
+
+
+def test_shrink_batch_size_halves_the_rejected_size(batch_limits):
+    batch_state = feature_layer_io.new_batch_state(4000)
+
+    feature_layer_io.shrink_batch_size(batch_state, 3000)
+    assert batch_state["size"] == 1500
+    feature_layer_io.shrink_batch_size(batch_state, 60)
+    assert batch_state["size"] == 50
@@ -0,0 +1,126 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+import flag_sample_points
+
+
+def check_rounded_scalar(v):
+    # The per-feature check flag_points used before check_rounded_array
+    if v is None:
+        return -1
+    tolerance_min = 0.0000001
+    tolerance_max = 1 - tolerance_min
+    fractional_degrees = abs(v) % 1
+    if fractional_degrees < tolerance_min or fractional_degrees > tolerance_max:
+        return 1
+    minutes = fractional_degrees * 60
+    fractional_minutes = minutes % 1
+    if fractional_minutes < tolerance_min or fractional_minutes > tolerance_max:
+        return 2
+    fractional_half_minutes = (minutes * 2) % 1
+    if (
+        fractional_half_minutes < tolerance_min
+        or fractional_half_minutes > tolerance_max
+    ):
+        return 3
+    return 0
+
+
+def check_cornered_scalar(v, isLongitude):
+    # The per-coordinate check flag_points used before check_cornered_array
+    orig_long_in_minutes = -6693.75
+    orig_lat_in_minutes = 2681.25
+    cell_size = 3.75
+    tolerance_min = 0.0000001
+    tolerance_max = cell_size - tolerance_min
+    if isLongitude:
+        fractional_minutes = abs(v * 60 - orig_long_in_minutes) % cell_size
+    else:
+        fractional_minutes = abs(v * 60 - orig_lat_in_minutes) % cell_size
+    if fractional_minutes < tolerance_min or fractional_minutes > tolerance_max:
+        return 1
+    return 0
+
+
+def coordinates(seed, num_points=2000):
+    # Random coordinates mixed with values on whole degrees, minutes, half minutes and quad corners
+    rng = np.random.default_rng(seed)
+    values = rng.uniform(-179, 179, num_points)
+    snapped = rng.integers(0, 5, num_points)
+    values[snapped == 1] = np.round(values[snapped == 1])
+    values[snapped == 2] = np.round(values[snapped == 2] * 60) / 60
+    values[snapped == 3] = np.round(values[snapped == 3] * 120) / 120
+    values[snapped == 4] = np.round(values[snapped == 4] * 16) / 16
+    values[::97] = np.nan
+    return values
+
+
+def test_check_rounded_array_matches_scalar():
+    values = np.concatenate(
+        [coordinates(0), [0.0, -0.0, 45.5, -45.25, 12.99999999, 1e-9, -117.0083333]]
+    )
+
+    flags = flag_sample_points.check_rounded_array(values)
+
+    expected = [check_rounded_scalar(None if np.isnan(v) else v) for v in values]
+    assert flags.dtype == np.int8
+    assert flags.tolist() == expected
+    assert set(expected) == {-1, 0, 1, 2, 3}
+
+
+def test_check_cornered_array_matches_scalar():
+    lats = coordinates(1) / 2
+    lons = coordinates(2)
+
+    flags = flag_sample_points.check_cornered_array(lats, lons)
+
+    expected = [
+        (
+            -1
+            if np.isnan(lat) or np.isnan(lon)
+            else int(
+                check_cornered_scalar(lat, False) == 1
+                and check_cornered_scalar(lon, True)
+            )
+        )
+        for lat, lon in zip(lats, lons)
+    ]
+    assert flags.dtype == np.int8
+    assert flags.tolist() == expected
+    assert set(expected) == {-1, 0, 1}
+
+
+def test_find_changed_flags_counts_changed_and_null_flags():
+    fields = ["Flag_RoundedY", "Flag_RoundedX"]
+    current_flags = {
+        "Flag_RoundedY": [0, 1, None, 2, 3],
+        "Flag_RoundedX": [0, 1, 1, 2, None],
+    }
+    new_flags = {
+        "Flag_RoundedY": np.array([0, 2, 1, 2, 3], dtype=np.int8),
+        "Flag_RoundedX": np.array([0, 1, 1, 2, 3], dtype=np.int8),
+    }
+    counts = {"unchanged": 0, "changed": 0, "null": 0}
+
+    changed = flag_sample_points.find_changed_flags(
+        current_flags, new_flags, fields, counts
+    )
+
+    assert changed.tolist() == [False, True, True, False, True]
+    assert counts == {"unchanged": 2, "changed": 3, "null": 2}
+
+
+def test_match_points_by_oid_follows_the_requested_order():
+    features = [
+        SimpleNamespace(attributes={"OBJECTID": 7}, geometry={"x": 7.0, "y": 70.0}),
+        SimpleNamespace(attributes={"OBJECTID": 3}, geometry={"x": 3.0, "y": 30.0}),
+        SimpleNamespace(attributes={"OBJECTID": 5}, geometry=None),
+    ]
+
+    xs, ys = flag_sample_points.match_points_by_oid(
+        np.array([3, 4, 5, 7]), features, "OBJECTID"
+    )
+
+    np.testing.assert_array_equal(xs, [3.0, np.nan, np.nan, 7.0])
+    np.testing.assert_array_equal(ys, [30.0, np.nan, np.nan, 70.0])
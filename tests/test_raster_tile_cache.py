@@ -0,0 +1,203 @@
+import os
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import raster_tile_cache
+
+no_data = 255
+grid = np.arange(300 * 200, dtype=np.int32).reshape(300, 200) % 11
+grid[grid == 3] = no_data
+x_min, y_max, cell_size = 1000.0, 5000.0, 10.0
+
+
+class FakeRaster:
+    def __init__(self, path):
+        self.path = path
+        self.extent = SimpleNamespace(XMin=x_min, YMax=y_max)
+        self.meanCellWidth = cell_size
+        self.meanCellHeight = cell_size
+        self.height, self.width = grid.shape
+        self.noDataValue = no_data
+
+
+@pytest.fixture
+def tile_reads(monkeypatch):
+    # Fresh cache state and a fake arcpy raster. Returns the list of (row, col, nrows, ncols) blocks read
+    reads = []
+
+    def raster_to_numpy_array(raster, lower_left_corner, ncols, nrows):
+        col = int(round((lower_left_corner.X - x_min) / cell_size))
+        row = int(round((y_max - lower_left_corner.Y) / cell_size)) - nrows
+        reads.append((row, col, nrows, ncols))
+        return grid[row : row + nrows, col : col + ncols].copy()
+
+    arcpy = raster_tile_cache.arcpy
+    monkeypatch.setattr(arcpy, "Raster", FakeRaster, raising=False)
+    monkeypatch.setattr(
+        arcpy, "Point", lambda x, y: SimpleNamespace(X=x, Y=y), raising=False
+    )
+    monkeypatch.setattr(
+        arcpy, "RasterToNumPyArray", raster_to_numpy_array, raising=False
+    )
+    monkeypatch.setattr(raster_tile_cache, "tile_size", 64)
+    monkeypatch.setattr(raster_tile_cache, "cache_max_bytes", 512 * 1024 * 1024)
+    monkeypatch.setattr(raster_tile_cache, "cache_folder", None)
+    monkeypatch.setattr(raster_tile_cache, "tile_cache", OrderedDict())
+    monkeypatch.setattr(raster_tile_cache, "tile_cache_bytes", 0)
+    monkeypatch.setattr(raster_tile_cache, "raster_info", {})
+    return reads
+
+
+def random_points(seed, num_points=3000):
+    # Points over the raster and a margin around it
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(x_min - 100, x_min + grid.shape[1] * cell_size + 100, num_points)
+    ys = rng.uniform(y_max - grid.shape[0] * cell_size - 100, y_max + 100, num_points)
+    return xs, ys
+
+
+def expected_values(xs, ys):
+    cols = np.floor((xs - x_min) / cell_size)
+    rows = np.floor((y_max - ys) / cell_size)
+    values = np.full(len(xs), np.nan)
+    for k, (row, col) in enumerate(zip(rows, cols)):
+        if 0 <= row < grid.shape[0] and 0 <= col < grid.shape[1]:
+            value = grid[int(row), int(col)]
+            values[k] = np.nan if value == no_data else value
+    return values
+
+
+def test_sample_raster_values(tile_reads, tmp_path):
+    xs, ys = random_points(0)
+
+    values = raster_tile_cache.sample_raster(str(tmp_path / "dem.tif"), xs, ys)
+
+    np.testing.assert_array_equal(values, expected_values(xs, ys))
+
+
+def test_sample_raster_reads_each_tile_once(tile_reads, tmp_path):
+    raster_path = str(tmp_path / "dem.tif")
+    xs, ys = random_points(1)
+
+    raster_tile_cache.sample_raster(raster_path, xs, ys)
+    raster_tile_cache.sample_raster(raster_path, xs[::-1], ys[::-1])
+
+    # 300 x 200 cells in 64 cell tiles, 5 rows by 4 columns of tiles, the edge tiles are partial
+    assert sorted(tile_reads) == sorted(
+        (row, col, min(64, 300 - row), min(64, 200 - col))
+        for row in range(0, 300, 64)
+        for col in range(0, 200, 64)
+    )
+    assert raster_tile_cache.tile_cache_bytes == grid.nbytes
+
+
+def test_sample_raster_only_reads_tiles_with_points(tile_reads, tmp_path):
+    xs = np.array([x_min + 5, x_min + 5, x_min - 50, x_min + 1995])
+    ys = np.array([y_max - 5, y_max - 2995, y_max + 50, y_max - 2995])
+
+    values = raster_tile_cache.sample_raster(str(tmp_path / "dem.tif"), xs, ys)
+
+    np.testing.assert_array_equal(values, expected_values(xs, ys))
+    assert sorted(tile_reads) == [(0, 0, 64, 64), (256, 0, 44, 64), (256, 192, 44, 8)]
+
+
+def test_tile_cache_stays_within_its_budget(tile_reads, tmp_path, monkeypatch):
+    tile_bytes = 64 * 64 * grid.itemsize
+    monkeypatch.setattr(raster_tile_cache, "cache_max_bytes", 3 * tile_bytes)
+    xs, ys = random_points(2)
+
+    values = raster_tile_cache.sample_raster(str(tmp_path / "dem.tif"), xs, ys)
+
+    np.testing.assert_array_equal(values, expected_values(xs, ys))
+    assert len(tile_reads) == 20
+    assert raster_tile_cache.tile_cache_bytes <= 3 * tile_bytes
+    assert raster_tile_cache.tile_cache_bytes == sum(
+        tile.nbytes for tile in raster_tile_cache.tile_cache.values()
+    )
+
+
+def test_disk_cache_is_memory_mapped_and_budgeted(tile_reads, tmp_path, monkeypatch):
+    raster_path = tmp_path / "dem.tif"
+    raster_path.write_bytes(b"raster")
+    raster_path = str(raster_path)
+    cache_folder = str(tmp_path / "tiles")
+    monkeypatch.setattr(raster_tile_cache, "cache_folder", cache_folder)
+    xs, ys = random_points(3)
+
+    raster_tile_cache.sample_raster(raster_path, xs, ys)
+    num_reads = len(tile_reads)
+    raster_tile_cache.clear_cache()
+    tile_bytes = 64 * 64 * grid.itemsize
+    monkeypatch.setattr(raster_tile_cache, "cache_max_bytes", 2 * tile_bytes)
+    values = raster_tile_cache.sample_raster(raster_path, xs, ys)
+
+    np.testing.assert_array_equal(values, expected_values(xs, ys))
+    assert len(tile_reads) == num_reads == len(os.listdir(cache_folder))
+    assert all(
+        isinstance(tile, np.memmap) for tile in raster_tile_cache.tile_cache.values()
+    )
+    assert raster_tile_cache.tile_cache_bytes <= 2 * tile_bytes
+
+
+def test_rewritten_raster_is_read_again(tile_reads, tmp_path, monkeypatch):
+    raster_path = tmp_path / "dem.tif"
+    raster_path.write_bytes(b"version 1")
+    monkeypatch.setattr(raster_tile_cache, "cache_folder", str(tmp_path / "tiles"))
+    xs, ys = random_points(4)
+
+    raster_tile_cache.sample_raster(str(raster_path), xs, ys)
+    num_reads = len(tile_reads)
+    raster_tile_cache.clear_cache()
+    raster_path.write_bytes(b"version 2, rewritten")
+    os.utime(raster_path, ns=(0, 10**18))
+    raster_tile_cache.sample_raster(str(raster_path), xs, ys)
+
+    assert len(tile_reads) == 2 * num_reads
+
+
+def test_raster_rewritten_in_a_geodatabase_is_read_again(
+    tile_reads, tmp_path, monkeypatch
+):
+    # A raster dataset has no file of its own, its blocks are stored in the tables of the geodatabase
+    gdb = tmp_path / "landforms.gdb"
+    gdb.mkdir()
+    table = gdb / "a00000009.gdbtable"
+    table.write_bytes(b"version 1")
+    monkeypatch.setattr(raster_tile_cache, "cache_folder", str(tmp_path / "tiles"))
+    xs, ys = random_points(5)
+
+    raster_tile_cache.sample_raster(str(gdb / "dem"), xs, ys)
+    num_reads = len(tile_reads)
+    raster_tile_cache.clear_cache()
+    gdb_stat = os.stat(gdb)
+    table.write_bytes(b"version 2")
+    os.utime(table, ns=(0, 10**18))
+    # Rewriting a table in place leaves the modification time of the folder unchanged
+    os.utime(gdb, ns=(gdb_stat.st_atime_ns, gdb_stat.st_mtime_ns))
+    raster_tile_cache.sample_raster(str(gdb / "dem"), xs, ys)
+
+    assert len(tile_reads) == 2 * num_reads
+
+
+def test_damaged_tile_file_is_replaced(tile_reads, tmp_path, monkeypatch):
+    raster_path = tmp_path / "dem.tif"
+    raster_path.write_bytes(b"raster")
+    cache_folder = tmp_path / "tiles"
+    monkeypatch.setattr(raster_tile_cache, "cache_folder", str(cache_folder))
+    xs = np.array([x_min + 5])
+    ys = np.array([y_max - 5])
+
+    raster_tile_cache.sample_raster(str(raster_path), xs, ys)
+    (tile_file,) = cache_folder.iterdir()
+    # Cut the tile file short, as an interrupted run writing it in place would
+    tile_file.write_bytes(tile_file.read_bytes()[:200])
+    raster_tile_cache.clear_cache()
+    values = raster_tile_cache.sample_raster(str(raster_path), xs, ys)
+
+    np.testing.assert_array_equal(values, expected_values(xs, ys))
+    assert len(tile_reads) == 2
+    assert [f.name for f in cache_folder.iterdir()] == [tile_file.name]
+    assert np.load(tile_file).shape == (64, 64)